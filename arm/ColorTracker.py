@@ -3,10 +3,10 @@ sys.path.append('/home/pi/ArmPi/')
 from ArmIK.Transform import convertCoordinate, getCenter, getMaskROI, getROI
 import Camera
 from CameraCalibration.CalibrationConfig import square_length
+from color_segmenter import ColorSegmenter
 import cv2
 from LABConfig import color_range
 import logging
-import math
 import numpy as np
 
 DEBUG = logging.DEBUG
@@ -33,13 +33,14 @@ class ColorTracker:
         self.rois = {}
         self.coords = {}
         self.camera = Camera.Camera()
+        self.segmenter = ColorSegmenter(color_range)
 
     def set_target_colors(self, colors):
         if isinstance(colors, list):
             for c in colors:
                 if c not in RGB_RANGE.keys():
                     raise ValueError('Unexpected Color')
-                self.target_colors.append(colors)
+                self.target_colors.append(c)
         else:
             if colors not in RGB_RANGE.keys():
                 raise ValueError('Unexpected Color')
@@ -119,12 +120,9 @@ class ColorTracker:
         return frame_lab
 
     def detect_colors(self, frame_lab):
-        color_contours = {}
-        for c in self.target_colors:
-            contours = self.find_contours(frame_lab, c)
-            max_contour, max_contour_area = self.get_area_max_contour(contours)
-            color_contours[c] = (max_contour, max_contour_area)
-        return color_contours
+        # Segments all target colors in one pass rather than masking and
+        # finding contours per color
+        return self.segmenter.largest_components(frame_lab, self.target_colors)
 
     def post_process(self, img):
         detected_colors = self.rois.keys()
@@ -153,41 +151,6 @@ class ColorTracker:
 
         return img
 
-    def find_contours(self, frame_lab, color):
-        frame_mask = cv2.inRange(frame_lab,
-                                 color_range[color][0],
-                                 color_range[color][1])
-        # Opening (morphology)
-        opened = cv2.morphologyEx(frame_mask, cv2.MORPH_OPEN,
-                                  np.ones((6, 6), np.uint8))
-        # Closing (morphology)
-        closed = cv2.morphologyEx(opened, cv2.MORPH_CLOSE,
-                                  np.ones((6, 6), np.uint8))
-        contours = cv2.findContours(closed, cv2.RETR_EXTERNAL,
-                                    cv2.CHAIN_APPROX_NONE)[-2]
-        return contours
-
-    def get_area_max_contour(self, contours):
-        """
-        copies getAreaMaxContour from the original ColorTracking.py code
-        :param contours:
-        :return:
-        """
-        max_contour = None
-        max_contour_area = 0
-
-        for c in contours:  # for all contours
-            contour_area_temp = math.fabs(
-                cv2.contourArea(c))  # calculate the contour area
-            if contour_area_temp > max_contour_area:
-                max_contour_area = contour_area_temp
-                # only when the area is greater than 300,
-                # the contour of the maximum area is effective to filter interference
-                if contour_area_temp > 300:
-                    max_contour = c
-
-        return max_contour, max_contour_area  # return the max area contour
-
     def save_rois(self, color_contours):
         for color, contour_info in color_contours.items():
             contour = contour_info[0]
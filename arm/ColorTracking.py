@@ -7,6 +7,7 @@ import time
 import Camera
 import threading
 from LABConfig import color_range  # imports configured masks for the block colors
+from color_segmenter import ColorSegmenter  # finds all block colors in one pass over the frame
 from ArmIK.Transform import *  # includes getCenter, convertCoordinate, getROI, getMaskROI (used for perception task)
 from ArmIK.ArmMoveIK import *
 import HiwonderSDK.Board as Board
@@ -35,22 +36,6 @@ def setTargetColor(target_color):
     __target_color = target_color
     return (True, ())
 
-# find the maximum area contour
-# the parameter is a list of contours to be compared
-def getAreaMaxContour(contours):
-    contour_area_temp = 0
-    contour_area_max = 0
-    area_max_contour = None
-
-    for c in contours:  # for all contours
-        contour_area_temp = math.fabs(cv2.contourArea(c))  # calculate the countour area
-        if contour_area_temp > contour_area_max:
-            contour_area_max = contour_area_temp
-            if contour_area_temp > 300:  # only when the area is greater than 300, the contour of the maximum area is effective to filter interference
-                area_max_contour = c
-
-    return area_max_contour, contour_area_max  # return the maximum area countour
-
 
 # the angle at which the clamper is closed when gripping
 servo1 = 500
@@ -154,6 +139,7 @@ def exit():
 
 rect = None
 size = (640, 480)
+segmenter = ColorSegmenter(color_range)
 rotation_angle = 0
 unreachable = False
 world_X, world_Y = 0, 0
@@ -338,16 +324,13 @@ def run(img):
     area_max = 0
     areaMaxContour = 0
     if not start_pick_up:  # HAVE NOT STARTED PICKING UP ANYTHING
+        # FIND THE LARGEST CONTOUR OF EVERY TARGET COLOR IN ONE PASS OVER THE FRAME (after opening and closing each color's mask)
+        color_contours = segmenter.largest_components(frame_lab, [i for i in color_range if i in __target_color])
         for i in color_range:  # FOR ALL LAB CONFIGURED COLORS
             if i in __target_color:  # BUT ONLY FOR THE ACTUAL COLOR OF INTEREST
                 # GET MAXIMUM CONTOUR FOR THE COLOR OF INTEREST (aka finding area where the greatest amount of the target color is detected)
                 detect_color = i
-                # mathematical operation on the original image and mask (create mask on the color?)
-                frame_mask = cv2.inRange(frame_lab, color_range[detect_color][0], color_range[detect_color][1])
-                opened = cv2.morphologyEx(frame_mask, cv2.MORPH_OPEN, np.ones((6, 6), np.uint8))  # Opening (morphology)
-                closed = cv2.morphologyEx(opened, cv2.MORPH_CLOSE, np.ones((6, 6), np.uint8))  # Closing (morphology)
-                contours = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)[-2] # find countour
-                areaMaxContour, area_max = getAreaMaxContour(contours)  # find the maximum countour
+                areaMaxContour, area_max = color_contours[detect_color]  # find the maximum countour
 
         # IF AREA OF MAXIMUM CONTOUR MATCHES THE SIZE OF THE BLOCK
         if area_max > 2500:  # find the maximum area
@@ -0,0 +1,125 @@
+"""
+Segments a LAB frame into all the configured block colors in one pass.
+
+Finding blocks one color at a time, as ColorTracking.run did, runs
+inRange, a morphological open and close and findContours over the whole
+frame for every color. Here each color gets one bit of a label image
+instead. Every color range in LABConfig is a box in LAB space, so whether a
+pixel is in a range is decided channel by channel: a 256 entry lookup table
+per channel holds, for each value, the bits of the colors whose range
+includes it, and a pixel's label is the AND of its three lookups. That is
+three cv2.LUT calls and two ANDs however many colors there are, and a pixel
+in overlapping ranges keeps the bit of each, as separate inRange calls
+would give.
+
+The open, close and contour search then only run on the bounding box of
+each color's pixels (with a margin for the morphology), so colors absent
+from the frame cost next to nothing.
+
+    segmenter = ColorSegmenter(color_range)
+    blocks = segmenter.largest_components(frame_lab, ['red', 'green'])
+    contour, area = blocks['red']
+"""
+import math
+
+import cv2
+import numpy as np
+
+MAX_COLORS = 8  # one bit of the uint8 label image per color
+MIN_CONTOUR_AREA = 300  # smaller contours are noise, as ColorTracking's getAreaMaxContour had it
+
+
+class ColorSegmenter:
+    """Labels pixels with the colors of `color_range` whose LAB range they
+    fall in, and finds each color's largest blob."""
+    def __init__(self, color_range, kernel_size=6):
+        """`color_range` maps color names to (lower, upper) LAB bounds, as
+        LABConfig.color_range does. The open and close use a square kernel
+        of `kernel_size` pixels."""
+        if len(color_range) > MAX_COLORS:
+            raise ValueError('At most {} colors can be segmented together, not {}'.format(
+                MAX_COLORS, len(color_range)))
+
+        self.bits = {}
+        lut = np.zeros((256, 3), np.uint8)
+        values = np.arange(256)[:, None]
+        for i, (color, (lower, upper)) in enumerate(color_range.items()):
+            bit = 1 << i
+            self.bits[color] = bit
+            inside = (values >= np.asarray(lower)) & (values <= np.asarray(upper))
+            lut[inside] |= bit
+        self.luts = [np.ascontiguousarray(lut[:, i]) for i in range(3)]
+
+        self.kernel = np.ones((kernel_size, kernel_size), np.uint8)
+        # Opening then closing moves a blob's edge by less than two kernels
+        self.margin = 2 * kernel_size
+        self._buffers = {}
+
+    def segment(self, frame_lab):
+        """Returns the label image of `frame_lab`: for every pixel, the OR
+        of the bits of the colors it matches. The array is reused by the
+        next call for a frame of the same size."""
+        shape = frame_lab.shape[:2]
+        if shape not in self._buffers:
+            self._buffers[shape] = [np.empty(shape, np.uint8) for _ in range(5)]
+        channels = self._buffers[shape][:3]
+        bits, labels = self._buffers[shape][3:]
+
+        # Single channel lookups are much faster than one 3 channel lookup
+        cv2.split(frame_lab, channels)
+        cv2.LUT(channels[0], self.luts[0], dst=labels)
+        for channel, lut in zip(channels[1:], self.luts[1:]):
+            cv2.LUT(channel, lut, dst=bits)
+            cv2.bitwise_and(labels, bits, dst=labels)
+        return labels
+
+    def mask(self, labels, color):
+        """Returns the 0/255 mask of `color` in a label image, like
+        cv2.inRange with the color's range gives."""
+        bit = self.bits[color]
+        return cv2.compare(cv2.bitwise_and(labels, bit), 0, cv2.CMP_GT)
+
+    def largest_components(self, frame_lab, colors=None):
+        """Returns a dict of (largest contour, its area) for each of `colors`
+        (default: all), after an open and close of the color's mask. The
+        contour is None unless its area is over MIN_CONTOUR_AREA, and the
+        area is 0 for a color that is not in the frame, as
+        largest_contour gives them."""
+        labels = self.segment(frame_lab)
+        if colors is None:
+            colors = self.bits.keys()
+
+        components = {}
+        for color in colors:
+            mask = self.mask(labels, color)
+            x, y, w, h = cv2.boundingRect(mask)
+            if w == 0:
+                components[color] = (None, 0)
+                continue
+
+            height, width = mask.shape
+            left, top = max(0, x - self.margin), max(0, y - self.margin)
+            right, bottom = min(width, x + w + self.margin), min(height, y + h + self.margin)
+            crop = mask[top:bottom, left:right]
+            opened = cv2.morphologyEx(crop, cv2.MORPH_OPEN, self.kernel)
+            closed = cv2.morphologyEx(opened, cv2.MORPH_CLOSE, self.kernel)
+            contours = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE,
+                                        offset=(left, top))[-2]
+            components[color] = largest_contour(contours)
+        return components
+
+
+def largest_contour(contours):
+    """Returns the contour of the largest area and that area, with the
+    contour None unless the area is over MIN_CONTOUR_AREA. This is the
+    getAreaMaxContour of the original ColorTracking code, shared by the
+    trackers."""
+    max_contour = None
+    max_contour_area = 0
+    for c in contours:
+        contour_area = math.fabs(cv2.contourArea(c))
+        if contour_area > max_contour_area:
+            max_contour_area = contour_area
+            if contour_area > MIN_CONTOUR_AREA:
+                max_contour = c
+    return max_contour, max_contour_area
@@ -0,0 +1,87 @@
+"""
+Compares finding the largest block of each color one color at a time, as
+ColorTracking.run and ColorTracker.detect_colors did (inRange, open, close
+and findContours over the whole frame per color), with ColorSegmenter's
+single pass, for 1 to 8 colors, and checks that both find the same blocks.
+
+    python3 color_segmenter_benchmark.py [repeats]
+
+Frames are synthetic 640x480 LAB images: a noisy grey table with a 60x60
+block of each of three colors on it, blurred as ColorTracker.pre_process
+blurs camera frames. The other colors are configured but absent, as most
+of the configured colors usually are.
+"""
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from color_segmenter import ColorSegmenter, largest_contour
+
+# LAB centre of each color; its range is +-20 around it
+CENTRES = {
+    'red': (120, 180, 160),
+    'green': (140, 80, 170),
+    'blue': (80, 170, 70),
+    'yellow': (220, 120, 200),
+    'orange': (160, 160, 190),
+    'purple': (90, 170, 100),
+    'cyan': (200, 90, 110),
+    'brown': (90, 140, 160),
+}
+COLOR_RANGE = {c: (tuple(v - 20 for v in lab), tuple(v + 20 for v in lab))
+               for c, lab in CENTRES.items()}
+BLOCKS = {'red': (100, 100), 'green': (300, 250), 'blue': (480, 120)}
+
+
+def synthetic_frame(seed=0):
+    rng = np.random.default_rng(seed)
+    frame = rng.normal(128, 6, (480, 640, 3)).clip(0, 255).astype(np.uint8)
+    for color, (x, y) in BLOCKS.items():
+        frame[y:y + 60, x:x + 60] = CENTRES[color]
+    return cv2.GaussianBlur(frame, (11, 11), 11)
+
+
+def per_color(frame_lab, colors):
+    """The original detection: a full frame pass per color."""
+    color_contours = {}
+    for color in colors:
+        frame_mask = cv2.inRange(frame_lab, COLOR_RANGE[color][0], COLOR_RANGE[color][1])
+        opened = cv2.morphologyEx(frame_mask, cv2.MORPH_OPEN, np.ones((6, 6), np.uint8))
+        closed = cv2.morphologyEx(opened, cv2.MORPH_CLOSE, np.ones((6, 6), np.uint8))
+        contours = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)[-2]
+        color_contours[color] = largest_contour(contours)
+    return color_contours
+
+
+def same_blocks(blocks, other_blocks):
+    for color, (contour, area) in blocks.items():
+        other_contour, other_area = other_blocks[color]
+        if area != other_area or (contour is None) != (other_contour is None):
+            return False
+        if contour is not None and not np.array_equal(contour, other_contour):
+            return False
+    return True
+
+
+def ms_per_frame(detect, frame_lab, colors, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        detect(frame_lab, colors)
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+if __name__ == '__main__':
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    frame_lab = synthetic_frame()
+    segmenter = ColorSegmenter(COLOR_RANGE)
+
+    print('{:>7} {:>14} {:>14} {:>6}'.format('colors', 'per color ms', 'one pass ms', 'same'))
+    for n in range(1, len(COLOR_RANGE) + 1):
+        colors = list(COLOR_RANGE)[:n]
+        before = ms_per_frame(per_color, frame_lab, colors, repeats)
+        after = ms_per_frame(segmenter.largest_components, frame_lab, colors, repeats)
+        same = same_blocks(per_color(frame_lab, colors),
+                           segmenter.largest_components(frame_lab, colors))
+        print('{:>7} {:>14.3f} {:>14.3f} {:>6}'.format(n, before, after, str(same)))
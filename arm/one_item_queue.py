@@ -1,4 +1,5 @@
-from multiprocessing import Lock, Pipe, Semaphore
+from multiprocessing import Lock, Pipe, Semaphore, shared_memory
+import numpy as np
 import pickle
 import queue # only for queue.Empty exception
 
@@ -48,4 +49,113 @@ class OneItemQueue:
         self.sem.release()
 
     def _clear(self):
-        self.sem.acquire(False)
\ No newline at end of file
+        self.sem.acquire(False)
+
+
+# Indices of the sequence numbers in SharedFrameQueue's header
+PUT = 0  # last item completely put
+TAKEN = 1  # last item taken by get_nowait()
+STARTED = 2  # last item put() has started copying in
+
+
+class SharedFrameQueue:
+    """A OneItemQueue for fixed-size numpy arrays (e.g. camera frames) that
+    hands items between processes through shared memory instead of pickling
+    them through a pipe.
+    put() copies the array into the next buffer of a small ring of
+    preallocated buffers and then publishes it by bumping a sequence counter.
+    get_nowait() returns a read-only view of the newest buffer without
+    copying it. A producer that is faster than the consumer overwrites that
+    buffer once `slots - 1` more items have been put, so a consumer that
+    keeps the view for a while should take it with get_seq_nowait() and
+    check valid(seq) once it is done with it, or take a checked copy with
+    get_copy_nowait().
+    Like SharedBus in rossros_mp, put() bumps a started counter before it
+    copies and the put counter after, so a reader can tell whether the
+    buffer it read has been rewritten since.
+    Only one process should put() into the queue.
+    """
+    def __init__(self, shape, dtype='uint8', slots=3):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        self.lock = Lock()
+        self._slot_size = int(np.prod(self.shape)) * self.dtype.itemsize
+        # 64 bytes of header: the PUT, TAKEN and STARTED sequence numbers
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=64 + slots * self._slot_size)
+        self._owner = True
+        self._attach()
+        self._seq[:] = 0
+
+    def _attach(self):
+        self._seq = np.ndarray((3,), np.int64, buffer=self._shm.buf)
+        self._buffers = [np.ndarray(self.shape, self.dtype, buffer=self._shm.buf,
+                                    offset=64 + i * self._slot_size)
+                         for i in range(self.slots)]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_shm'], state['_seq'], state['_buffers']
+        state['_shm_name'] = self._shm.name
+        return state
+
+    def __setstate__(self, state):
+        self._shm = shared_memory.SharedMemory(name=state.pop('_shm_name'))
+        self.__dict__.update(state)
+        self._owner = False
+        self._attach()
+
+    def put(self, obj):
+        """Replaces the current item, if any, with a copy of the array `obj`."""
+        seq = int(self._seq[PUT]) + 1
+        self._seq[STARTED] = seq
+        self._buffers[seq % self.slots][...] = obj
+        self._seq[PUT] = seq
+
+    def valid(self, seq):
+        """Returns whether the buffer of item `seq` still holds that item,
+        i.e. no put() of a later item into the same buffer has started."""
+        return int(self._seq[STARTED]) < seq + self.slots
+
+    def get_seq_nowait(self):
+        """Removes the current item and returns (its sequence number, a view
+        of it), or raises queue.Empty. Pass the sequence number to valid()
+        to check that the view has not been overwritten."""
+        with self.lock:
+            while True:
+                seq = int(self._seq[PUT])
+                if seq == self._seq[TAKEN]:
+                    raise queue.Empty
+                # The producer may have lapped the ring since it put seq
+                if self.valid(seq):
+                    break
+            self._seq[TAKEN] = seq
+        view = self._buffers[seq % self.slots].view()
+        view.flags.writeable = False
+        return seq, view
+
+    def get_nowait(self):
+        """Removes the current item and returns a view of it, or raises
+        queue.Empty."""
+        return self.get_seq_nowait()[1]
+
+    def get_copy_nowait(self):
+        """Removes the current item and returns a copy of it that is known
+        not to have been overwritten while it was copied, or raises
+        queue.Empty."""
+        while True:
+            seq, view = self.get_seq_nowait()
+            item = view.copy()
+            if self.valid(seq):
+                return item
+            # Overwritten while copying, so newer items have been put since:
+            # take the newest instead
+
+    def close(self):
+        """Unmaps the shared memory, and frees it in the creating process."""
+        self._seq = None
+        self._buffers = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
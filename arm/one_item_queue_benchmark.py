@@ -0,0 +1,92 @@
+"""
+Compares how many frames per second OneItemQueue (pickle + pipe) and
+SharedFrameQueue (shared memory ring) can hand from a producer process to a
+consumer process, at several frame sizes.
+
+    python3 one_item_queue_benchmark.py [seconds per measurement]
+
+OneItemQueue.put() writes the whole pickled item into the pipe while holding
+its lock, so an item larger than the pipe buffer (64 KiB on Linux) blocks
+the producer, and the consumer then waits on the lock. Those runs are
+reported as stalled.
+"""
+from multiprocessing import Event, Process, Value
+import queue
+import sys
+import time
+
+import numpy as np
+
+from one_item_queue import OneItemQueue, SharedFrameQueue
+
+FRAME_SIZES = [(120, 160, 3), (240, 320, 3), (480, 640, 3)]
+
+
+def produce(q, frame, stop, puts):
+    n = 0
+    while not stop.is_set():
+        q.put(frame)
+        n += 1
+        puts.value = n
+
+
+def consume(q, stop, gets):
+    n = 0
+    checksum = 0
+    while not stop.is_set():
+        try:
+            item = q.get_nowait()
+        except queue.Empty:
+            continue
+        # touch the frame so a lazily mapped item is actually read
+        checksum += int(item[-1, -1, -1])
+        n += 1
+        gets.value = n
+
+
+def measure(q, shape, duration):
+    """Returns (puts per second, gets per second) over `duration` seconds,
+    or None if the queue stalled."""
+    frame = np.random.randint(0, 255, shape, dtype=np.uint8)
+    stop = Event()
+    puts = Value('q', 0, lock=False)
+    gets = Value('q', 0, lock=False)
+    processes = [Process(target=produce, args=(q, frame, stop, puts)),
+                 Process(target=consume, args=(q, stop, gets))]
+    for p in processes:
+        p.start()
+
+    start = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    elapsed = time.perf_counter() - start
+    put_count, get_count = puts.value, gets.value
+
+    stalled = False
+    for p in processes:
+        p.join(timeout=2)
+        if p.is_alive():
+            p.terminate()
+            p.join()
+            stalled = True
+    if stalled:
+        return None
+    return put_count / elapsed, get_count / elapsed
+
+
+def main(duration=2.0):
+    print('{:>12s} {:>18s} {:>12s} {:>12s}'.format('frame', 'queue', 'puts/sec', 'gets/sec'))
+    for shape in FRAME_SIZES:
+        label = '{}x{}'.format(shape[1], shape[0])
+        shared = SharedFrameQueue(shape)
+        for name, q in (('OneItemQueue', OneItemQueue()), ('SharedFrameQueue', shared)):
+            rates = measure(q, shape, duration)
+            if rates is None:
+                print('{:>12s} {:>18s} {:>25s}'.format(label, name, 'stalled'))
+            else:
+                print('{:>12s} {:>18s} {:>12.0f} {:>12.0f}'.format(label, name, *rates))
+        shared.close()
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 2.0)
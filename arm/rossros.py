@@ -14,18 +14,29 @@ logging.basicConfig(format=logging_format, level=logging.INFO,
 class Bus:
     """
     Class to allow a single element data bus.
+
+    Whether reads and writes go through the logging decorators is decided
+    once, when the bus is created. Unless told otherwise, a bus is only
+    instrumented if DEBUG messages from this module would be emitted at that
+    point, so that busses created with logging off only pay for the lock.
     """
 
-    def __init__(self, initial_message=0, name="Unnamed Bus"):
+    def __init__(self, initial_message=0, name="Unnamed Bus", instrument=None):
         self.message = initial_message
         self.name = name
 
         # Set up the class so that functions can get a lock while working
         self.lock = rwlock.RWLockWriteD()
 
-    @log_on_start(DEBUG, "{self.name:s}: Initiating read by {_name:s}")
-    @log_on_error(DEBUG, "{self.name:s}: Error on read by {_name:s}")
-    @log_on_end(DEBUG, "{self.name:s}: Finished read by {_name:s}")
+        # Bind the logged accessors over the plain ones if instrumentation is
+        # requested, or if it is left unspecified and DEBUG logging is active
+        if instrument is None:
+            instrument = logging.getLogger(__name__).isEnabledFor(DEBUG)
+        self.instrumented = instrument
+        if self.instrumented:
+            self.get_message = self._logged_get_message
+            self.set_message = self._logged_set_message
+
     def get_message(self, _name):
 
         with self.lock.gen_rlock():
@@ -33,14 +44,25 @@ class Bus:
 
         return message
 
-    @log_on_start(DEBUG, "{self.name:s}: Initiating write by {_name:s}")
-    @log_on_error(DEBUG, "{self.name:s}: Error on write by {_name:s}")
-    @log_on_end(DEBUG, "{self.name:s}: Finished write by {_name:s}")
     def set_message(self, message, _name):
 
         with self.lock.gen_wlock():
             self.message = message
 
+    @log_on_start(DEBUG, "{self.name:s}: Initiating read by {_name:s}")
+    @log_on_error(DEBUG, "{self.name:s}: Error on read by {_name:s}")
+    @log_on_end(DEBUG, "{self.name:s}: Finished read by {_name:s}")
+    def _logged_get_message(self, _name):
+
+        return type(self).get_message(self, _name)
+
+    @log_on_start(DEBUG, "{self.name:s}: Initiating write by {_name:s}")
+    @log_on_error(DEBUG, "{self.name:s}: Error on write by {_name:s}")
+    @log_on_end(DEBUG, "{self.name:s}: Finished write by {_name:s}")
+    def _logged_set_message(self, message, _name):
+
+        type(self).set_message(self, message, _name)
+
 
 # Create a set of default input and output busses
 default_termination_bus = Bus(False)
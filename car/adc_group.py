@@ -0,0 +1,98 @@
+"""
+adc_group.py
+
+Reads several channels of the PiCar-X ADC together, e.g. the three
+grayscale sensors.
+
+Reading a channel with ezblock's ADC.read takes three I2C transactions (a
+channel select sent as a word write, then two single byte reads), and
+goes through send/recv's argument parsing and debug formatting on the way.
+ADCGroup keeps the channel commands precomputed, issues the transactions
+directly, and writes the results into a preallocated array. With
+block_reads=True each channel is read in one transaction, a block read of
+two bytes from the channel's command register, for MCU firmware that
+answers those.
+"""
+
+import numpy as np
+
+try:
+    from ezblock import I2C
+except ImportError:
+    from sim_ezblock import I2C
+
+
+class ADCGroup(I2C):
+    ADDR = 0x14
+
+    def __init__(self, channels=('A0', 'A1', 'A2'), block_reads=False):
+        """
+        :param channels: sequence of channel names ('A0'-'A7') or numbers
+        :param block_reads: bool, read each channel with one block read
+            instead of a select and two byte reads
+        """
+        super().__init__()
+        self.commands = []
+        for chn in channels:
+            if isinstance(chn, str):
+                if not chn.startswith("A"):
+                    raise ValueError("ADC channel should be between [A0, A7], not {0}".format(chn))
+                chn = int(chn[1:])
+            if chn < 0 or chn > 7:
+                raise ValueError("ADC channel should be between [A0, A7], not A{0}".format(chn))
+            self.commands.append((7 - chn) | 0x10)
+
+        self.block_reads = block_reads
+        self.values = np.zeros(len(self.commands), dtype=np.int64)
+
+    def read(self, out=None):
+        """
+        Reads every channel of the group, in order
+        :param out: array to write the values to, or None to reuse the
+            group's own array, which is overwritten by the next read
+        :return: array of the raw values (0-4095)
+        """
+        if out is None:
+            out = self.values
+
+        if self.block_reads:
+            read_block = self._i2c_read_i2c_block_data
+            for i, command in enumerate(self.commands):
+                value_h, value_l = read_block(self.ADDR, command, 2)
+                out[i] = (value_h << 8) + value_l
+        else:
+            select = self._i2c_write_word_data
+            read_byte = self._i2c_read_byte
+            for i, command in enumerate(self.commands):
+                select(self.ADDR, command, 0)
+                value_h = read_byte(self.ADDR)
+                value_l = read_byte(self.ADDR)
+                out[i] = (value_h << 8) + value_l
+
+        return out
+
+    def read_list(self):
+        """
+        :return: list of the raw values, as returned by separate ADC.reads
+        """
+        return self.read().tolist()
+
+
+def test():
+    from sim_ezblock import ADC
+
+    # Count the transactions of a grayscale triple, which only the simulated bus does
+    if not hasattr(I2C, 'transactions'):
+        print('Transaction counts are only available with sim_ezblock')
+        return
+    adcs = [ADC('A0'), ADC('A1'), ADC('A2')]
+    for name, read in (('ADC.read x3', lambda: [adc.read() for adc in adcs]),
+                       ('ADCGroup', ADCGroup().read),
+                       ('ADCGroup block reads', ADCGroup(block_reads=True).read)):
+        I2C.transactions = 0
+        read()
+        print('{:>22s}: {} transactions'.format(name, I2C.transactions))
+
+
+if __name__ == '__main__':
+    test()
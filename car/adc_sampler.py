@@ -0,0 +1,104 @@
+"""
+adc_sampler.py
+
+Samples ADC channels continuously in the background, so that control loops
+read filtered values from memory instead of waiting on I2C themselves.
+
+ADCSampler is a rossros Producer that reads an ADCGroup at a fixed rate
+(with the 'rate' schedule, so I2C time does not stretch the period) into a
+HistoryBus. The bus keeps a ring buffer of timestamped samples per channel,
+and its read filter decimates them for the nodes that read it: a control
+loop at 50 Hz reading a 500 Hz sampler with read_filter='mean' and
+read_window=10 gets the average of the samples since its last step.
+
+    sampler = ADCSampler(rate=500, read_filter='median', read_window=5,
+                         termination_busses=timer_bus)
+    interpreter = ConsumerProducer(photosensor_interp.relative_line_position,
+                                   sampler.history_bus, photosensor_interp_bus,
+                                   delay=0.02, termination_busses=timer_bus)
+    runConcurrently([sampler, interpreter, ...])
+"""
+
+import numpy as np
+from logdecorator import log_on_start, log_on_end, log_on_error
+
+from adc_group import ADCGroup
+from rossros import DEBUG, HISTORY_FILTERS, HistoryBus, Producer, default_termination_bus
+
+
+class ADCSampler(Producer):
+    """
+    ADCSampler is a producer that reads a group of ADC channels every
+    1/rate seconds into its history_bus, a HistoryBus holding the last
+    capacity samples of every channel
+    """
+
+    @log_on_start(DEBUG, "{name:s}: Starting to create ADC sampler")
+    @log_on_error(DEBUG, "{name:s}: Encountered an error while creating ADC sampler")
+    @log_on_end(DEBUG, "{name:s}: Finished creating ADC sampler")
+    def __init__(self,
+                 adc_group=None,  # ADCGroup to read, the three grayscale channels if None
+                 rate=500,  # samples per second
+                 capacity=256,  # samples kept per channel
+                 read_filter='mean',  # filter applied to reads of history_bus
+                 read_window=None,  # samples the mean and median are taken over
+                 ema_alpha=0.2,  # weight of each new sample in the 'ema' filter
+                 termination_busses=default_termination_bus,
+                 name="Unnamed ADC sampler"):
+
+        if rate <= 0:
+            raise ValueError("ADC sampling rate should be positive, not {0}".format(rate))
+
+        if adc_group is None:
+            adc_group = ADCGroup()
+        self.adc_group = adc_group
+
+        # By default, average over the samples taken in 10 ms
+        if read_window is None:
+            read_window = max(1, int(rate / 100))
+
+        channels = len(adc_group.commands)
+        self.history_bus = HistoryBus(np.zeros(channels), name=name + " history",
+                                      capacity=capacity, shape=(channels,),
+                                      read_filter=read_filter, read_window=read_window,
+                                      ema_alpha=ema_alpha)
+
+        super().__init__(
+            self.sample,  # ADCSampler class defines its own producer function
+            self.history_bus,
+            1 / rate,
+            termination_busses,
+            name,
+            schedule='rate')
+
+    def sample(self):
+        # The group reuses its array, which the bus would otherwise hold on to
+        return self.adc_group.read().copy()
+
+    def read(self, read_filter=None, window=None):
+        """
+        Reads the latest samples without waiting for the ADC
+        :param read_filter: None for the newest sample, or 'mean', 'median'
+            or 'ema'
+        :param window: int, samples the mean and median are taken over,
+            the bus's read_window if None
+        :return: tuple, (time.monotonic() of the newest sample, array of
+            one value per channel), or (None, zeros) before the first sample
+        """
+        if read_filter not in HISTORY_FILTERS:
+            raise ValueError("read_filter should be one of {0}, not {1}".format(HISTORY_FILTERS,
+                                                                              read_filter))
+        if window is None:
+            window = self.history_bus.read_window
+        times, values = self.history_bus.last_with_times(window)
+        if not len(times):
+            return None, self.history_bus.get_message(self.name)
+        newest = float(times[-1])
+
+        if read_filter == 'mean':
+            return newest, values.mean(axis=0)
+        if read_filter == 'median':
+            return newest, np.median(values, axis=0)
+        if read_filter == 'ema':
+            return newest, self.history_bus.ema()
+        return newest, values[-1]
@@ -0,0 +1,33 @@
+"""
+calibrate_grayscale.py
+
+Builds the grayscale lookup tables used by LineEstimator. Run it, then
+slowly slide the car sideways back and forth across the line until the
+sweep ends, so that every sensor passes over both the line and the floor.
+"""
+
+import sys
+import time
+
+from adc_group import ADCGroup
+from interpreter_class import GRAYSCALE_CALIBRATION_FILE, LineEstimator
+
+SWEEP_SECONDS = 5
+SAMPLE_DELAY = 0.005
+
+if __name__ == "__main__":
+    calibration_file = sys.argv[1] if len(sys.argv) > 1 else GRAYSCALE_CALIBRATION_FILE
+    adcs = ADCGroup()
+    samples = []
+    print('Sweeping for {} s, move the car across the line'.format(SWEEP_SECONDS))
+    end = time.monotonic() + SWEEP_SECONDS
+    while time.monotonic() < end:
+        samples.append(adcs.read_list())
+        time.sleep(SAMPLE_DELAY)
+
+    estimator = LineEstimator()
+    estimator.calibrate(samples)
+    estimator.save(calibration_file)
+    print('line levels:  {}'.format(estimator.line_levels))
+    print('floor levels: {}'.format(estimator.floor_levels))
+    print('saved to {}'.format(calibration_file))
@@ -0,0 +1,282 @@
+"""
+camera_capture.py
+
+Grabs camera frames continuously in a background thread, so that vision
+code always gets the newest frame without waiting for the camera.
+
+cv2.VideoCapture.read blocks until the driver hands over a frame, and the
+driver queues frames, so a reader that falls behind gets old ones. Here a
+thread reads the camera as fast as it delivers, into a small pool of
+preallocated buffers, and publishes each frame as the newest one, with the
+time it was captured and a sequence number. Readers get that frame itself,
+not a copy: it stays unchanged until pool_size - 1 newer frames have been
+captured, after which its buffer is reused.
+
+    camera = CameraCapture(0)  # nothing is opened yet
+    frame = camera.read()  # opens the camera and waits for its first frame
+    angle = color_interp.steering_angle(frame.image)
+    frame = camera.wait(after=frame.sequence)  # the next new frame
+
+TestSource stands in for the camera, playing a video file or generating
+frames of a lane, at a fixed frame rate. Run this file to time the lane
+following pipeline on one:
+
+    python3 camera_capture.py [video file] [--fps N] [--seconds S]
+"""
+
+import argparse
+import logging
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+Frame = namedtuple('Frame', ['image', 'timestamp', 'sequence'])
+
+
+class CameraCapture:
+    def __init__(self, source=0, pool_size=3, retry_delay=0.1):
+        """
+        :param source: camera index or video file path to open with
+            cv2.VideoCapture, or an opened source with read(image) and
+            release(), such as TestSource
+        :param pool_size: int, frame buffers to capture into, at least 2
+        :param retry_delay: float, seconds to wait after a failed read of
+            a camera before trying again. Any other source has ended when a
+            read fails
+        """
+        if pool_size < 2:
+            raise ValueError("Frame pool should hold at least 2 frames, not {0}".format(pool_size))
+
+        self.source = source
+        self.pool = [None] * pool_size
+        self.retry_delay = retry_delay
+
+        self.frames = 0  # frames captured
+        self.failed_reads = 0
+        self.ended = False  # the source could not be opened, or ran out of frames
+
+        self._capture = None
+        self._thread = None
+        self._running = False
+        self._started = False  # read() has been called
+        self._latest = None
+        self._new_frame = threading.Condition()
+
+    def start(self):
+        """
+        Opens the source, if it is not open yet, and starts capturing
+        """
+        if self._thread is not None or self.ended:
+            return
+        if self._capture is None:
+            if isinstance(self.source, (int, str)):
+                self._capture = cv2.VideoCapture(self.source)
+                if not self._capture.isOpened():
+                    # No such camera or file: end here, so that reads return
+                    # at once instead of waiting on frames that never come
+                    logging.error("CameraCapture: could not open %s", self.source)
+                    self._capture.release()
+                    self._capture = None
+                    self.ended = True
+                    return
+            else:
+                self._capture = self.source
+        self._running = True
+        self._thread = threading.Thread(target=self._grab_frames, daemon=True,
+                                        name="camera capture")
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops capturing and releases the source. Frames already read stay
+        valid
+        """
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def latest(self):
+        """
+        :return: Frame, the newest frame, or None if there is none yet.
+            Does not start capturing
+        """
+        return self._latest
+
+    def read(self, timeout=1.0):
+        """
+        Gets the newest frame. The first read starts the capture and waits
+        for its first frame; later reads never wait
+        :param timeout: float, seconds the first read waits for a frame
+        :return: Frame, or None if there is no frame (yet), or the source
+            could not be opened
+        """
+        if not self._started:
+            self._started = True
+            self.start()
+            return self.wait(timeout=timeout)
+        return self._latest
+
+    def wait(self, after=None, timeout=None):
+        """
+        Waits for a frame newer than the one numbered after
+        :param after: int, sequence number of the last frame seen, None to
+            take any frame
+        :param timeout: float, seconds to wait at most, None for no limit
+        :return: Frame, or None if none came in time or the video ended
+        """
+        after = -1 if after is None else after
+        with self._new_frame:
+            self._new_frame.wait_for(
+                lambda: (self._latest is not None and self._latest.sequence > after)
+                or self.ended or not self._running, timeout)
+            if self._latest is not None and self._latest.sequence > after:
+                return self._latest
+            return None
+
+    def _grab_frames(self):
+        sequence = 0
+        while self._running:
+            # Capture into the buffer of the oldest frame
+            slot = sequence % len(self.pool)
+            ok, image = self._capture.read(self.pool[slot])
+            stamp = time.monotonic()
+            if not ok:
+                self.failed_reads += 1
+                if not isinstance(self.source, int):
+                    self.ended = True
+                    break
+                time.sleep(self.retry_delay)
+                continue
+
+            # cv2 allocates a new image when the buffer does not fit, keep it
+            self.pool[slot] = image
+            with self._new_frame:
+                self._latest = Frame(image, stamp, sequence)
+                self.frames += 1
+                self._new_frame.notify_all()
+            sequence += 1
+
+        self._running = False
+        with self._new_frame:
+            self._new_frame.notify_all()
+
+
+class TestSource:
+    def __init__(self, path=None, fps=30, size=(480, 640), loop=True, seed=0):
+        """
+        Source of frames for CameraCapture without a camera, read at fps
+        frames per second
+        :param path: video file to play, or None to generate frames
+            of a floor with two lane lines in the colour LanePipeline
+            detects, swaying from side to side
+        :param fps: float, frames per second, None for as fast as possible
+        :param size: tuple, (height, width) of generated frames
+        :param loop: bool, restart the video file when it ends
+        :param seed: int, seed of the generated floor's noise
+        """
+        self.path = path
+        self.period = None if fps is None else 1 / fps
+        self.loop = loop
+        self.count = 0
+        self._next_time = None
+
+        if path is None:
+            self._video = None
+            height, width = size
+            rng = np.random.default_rng(seed)
+            self._floor = rng.integers(150, 220, (height, width, 3), dtype=np.uint8)
+            self._line_colour = cv2.cvtColor(np.uint8([[[75, 100, 35]]]),
+                                             cv2.COLOR_HSV2BGR)[0, 0].tolist()
+        else:
+            self._video = cv2.VideoCapture(path)
+            if not self._video.isOpened():
+                raise ValueError("Could not open video file {0}".format(path))
+
+    def read(self, image=None):
+        """
+        Waits for the next frame time and gets the frame
+        :param image: array to write the frame to, if it fits
+        :return: tuple, (True if there is a frame, frame)
+        """
+        if self.period is not None:
+            now = time.monotonic()
+            if self._next_time is None:
+                self._next_time = now
+            elif self._next_time > now:
+                time.sleep(self._next_time - now)
+            self._next_time += self.period
+
+        if self._video is None:
+            ok, image = True, self._draw(image)
+        else:
+            ok, image = self._video.read(image)
+            if not ok and self.loop:
+                self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok, image = self._video.read(image)
+        self.count += ok
+        return ok, image
+
+    def _draw(self, image):
+        if image is None or image.shape != self._floor.shape:
+            image = np.empty_like(self._floor)
+        np.copyto(image, self._floor)
+        height, width, _ = image.shape
+        shift = int(40 * np.sin(self.count / 10))
+        cv2.line(image, (width // 4 + shift, height), (width // 2 - 40 + shift, height // 3),
+                 self._line_colour, 6)
+        cv2.line(image, (3 * width // 4 + shift, height), (width // 2 + 40 + shift, height // 3),
+                 self._line_colour, 6)
+        return image
+
+    def release(self):
+        if self._video is not None:
+            self._video.release()
+
+
+def test():
+    from interpreter_class import ColorInterpreter
+
+    parser = argparse.ArgumentParser(description='lane following on captured test frames')
+    parser.add_argument('video', nargs='?', help='video file to play (default: generated frames)')
+    parser.add_argument('--fps', type=float, default=30, help='frames per second of the source')
+    parser.add_argument('--seconds', type=float, default=5, help='how long to run')
+    args = parser.parse_args()
+
+    color_interp = ColorInterpreter()
+    latencies = []
+    processed = 0
+    with CameraCapture(TestSource(args.video, fps=args.fps)) as camera:
+        frame = camera.read()
+        end = time.monotonic() + args.seconds
+        while frame is not None and time.monotonic() < end:
+            color_interp.steering_angle(frame.image)
+            latencies.append(time.monotonic() - frame.timestamp)
+            processed += 1
+            frame = camera.wait(after=frame.sequence, timeout=1.0)
+        captured = camera.frames
+
+    tracker = color_interp.lane_tracker
+    print('captured {} frames, processed {} ({} skipped as stale)'.format(
+        captured, processed, captured - processed))
+    print('frame age when processed: mean {:.2f} ms, max {:.2f} ms'.format(
+        1000 * np.mean(latencies), 1000 * np.max(latencies)))
+    print('lane tracker fell back to the Hough transform on {:.1%} of frames'.format(
+        tracker.fallback_rate))
+
+
+if __name__ == '__main__':
+    test()
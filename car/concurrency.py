@@ -5,13 +5,18 @@ Written Nicole Fronda - April 2021
 Bus class that acts as FIFO queue for messages between processes
 """
 
+from collections import deque
+
+
 class Bus:
-    def __init__(self, message_type):
+    def __init__(self, message_type, maxlen=100):
         '''
         :param message_type: string, one of ['sensor', 'rel_line_pos', 'angle']
+        :param maxlen: int, most sensor messages to hold. Once full, the
+            oldest message is dropped for each new one written
         '''
         self.message_type = message_type
-        self.message = []
+        self.message = deque(maxlen=maxlen)
 
     def write(self, value):
         '''
@@ -23,7 +28,7 @@ class Bus:
         # Don't want to queue up control input messages
         # This is intended to ensure controller uses only the latest processed data
         if self.message_type != 'sensor':
-            self.message = [value]
+            self.message = deque([value], maxlen=self.message.maxlen)
         else:
             self.message.append(value)
 
@@ -33,5 +38,5 @@ class Bus:
         """
         if len(self.message) == 0:
             return None
-        value = self.message.pop(0)
+        value = self.message.popleft()
         return value
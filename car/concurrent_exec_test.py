@@ -6,8 +6,8 @@ Script to test the producer-consumer functions in the Sensor, Interpreter,
 and Controller classes.
 """
 
-from rossros import Bus, ConsumerProducer, Printer, Producer, \
-    runConcurrently, Timer
+from rossros import Bus, ConsumerProducer, Printer, Producer, Timer
+from rossros_graph import Graph
 from controller_class import Controller
 from interpreter_class import PhotoSensorInterpreter, UltrasonicInterpreter
 from picarx_class import PiCarX
@@ -23,7 +23,7 @@ timer = Timer(timer_bus, delay=3)
 ### SET UP SENSORS AS PRODUCERS
 sens = Sensor(logging_on=True)
 photosensor_bus = Bus(name='greyscale sensor bus')
-ultrasonic_bus = Bus(name='greyscale sensor bus')
+ultrasonic_bus = Bus(name='ultrasonic sensor bus')
 photosensor_producer = Producer(sens.get_adc_values,
                                 photosensor_bus,
                                 delay=0,
@@ -33,7 +33,7 @@ ultrasonic_producer = Producer(sens.get_collision_distance,
                                ultrasonic_bus,
                                delay=0,
                                termination_busses=[timer_bus],
-                               name='photosensor producer')
+                               name='ultrasonic producer')
 
 
 ### SET UP INTERPRETERS AS CONSUMER-PRODUCER
@@ -61,7 +61,7 @@ controller = Controller(pi, logging_on=True)
 
 stop_bus = Bus(name='stop bus')
 stop_bus_con_prod = ConsumerProducer(controller.safety_stop,
-                                     ultrasonic_interp,
+                                     ultrasonic_interp_bus,
                                      stop_bus,
                                      delay=2,
                                      termination_busses=[timer_bus],
@@ -80,19 +80,23 @@ controller_con_prod = ConsumerProducer(controller.turn_to_line,
 photosensor_printer = Printer(photosensor_bus,
                          termination_busses=[timer_bus],
                          name='sensor printer',
-                         print_prefix='sensor values: ')
+                         print_prefix='sensor values: ',
+                         schedule='input')
 ultrasonic_printer = Printer(ultrasonic_bus,
                          termination_busses=[timer_bus],
                          name='interpreter printer',
-                         print_prefix='interpreter values: ')
+                         print_prefix='interpreter values: ',
+                         schedule='input')
 controller_printer = Printer(control_bus,
                              termination_busses=[timer_bus],
                              name='controller printer',
-                             print_prefix='controller values: ')
+                             print_prefix='controller values: ',
+                             schedule='input')
 stop_printer = Printer(stop_bus,
                        termination_busses=[timer_bus],
                        name='controller printer',
-                       print_prefix='controller values: ')
+                       print_prefix='controller values: ',
+                       schedule='input')
 
 producer_consumer_list = [timer,
                           photosensor_producer,
@@ -107,6 +111,11 @@ producer_consumer_list = [timer,
                           stop_printer
                           ]
 
+# The controllers drive the car, so keep them even if nothing reads their busses
+graph = Graph()
+for node in producer_consumer_list:
+    graph.add(node, keep=node in (stop_bus_con_prod, controller_con_prod))
+
 
 if __name__ == '__main__':
-    runConcurrently(producer_consumer_list)
+    graph.run()
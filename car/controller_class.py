@@ -7,6 +7,7 @@ Moves PiCar along a line given processed data from an Interpreter class
 
 import logging
 from logdecorator import log_on_start, log_on_end, log_on_error
+from collections import deque, namedtuple
 import time
 
 try:
@@ -25,6 +26,8 @@ logging.basicConfig(format=logging_format, level=logging.INFO,
                     datefmt ="%H:%M:%S")
 '''END LOGGING SETUP'''
 
+PIDTerms = namedtuple('PIDTerms', ['error', 'p', 'i', 'd', 'output', 'saturated', 'dt'])
+
 
 class Controller:
     def __init__(self, picarx_obj, scale=10, logging_on=False):
@@ -160,3 +163,269 @@ class Controller:
             else:
                 steer_angle = self.turn_to_angle(control_input, **kwargs)
                 self.pi.forward(speed, turn_angle=steer_angle)
+
+
+class SteeringController:
+    def __init__(self, picarx_obj, kp=30, ki=0, kd=2, derivative_tau=0.02,
+                 max_angle=35, max_rate=400, integral_limit=None, terms_bus=None,
+                 logging_on=False):
+        """
+        PID steering controller, to replace the proportional turn_to_line.
+        steer() can be used as the function of a rossros ConsumerProducer
+        reading a relative line position bus, at whatever rate the sensing
+        allows, since it never sleeps:
+
+            ConsumerProducer(steering.steer, line_bus, steering_bus,
+                             delay=0.01, schedule='rate')
+
+        :param picarx_obj: PiCarX object, the PiCar to control
+        :param kp: float, degrees of steering per unit of line offset
+        :param ki: float, degrees per unit offset-second
+        :param kd: float, degrees per unit offset per second
+        :param derivative_tau: float, time constant (s) of the low-pass
+            filter on the derivative, which would otherwise amplify noise
+        :param max_angle: float, largest steering angle magnitude, degrees
+        :param max_rate: float, largest steering change, degrees per second
+        :param integral_limit: float, largest magnitude of the integral term
+            in degrees, max_angle if None
+        :param terms_bus: Bus to also write the PIDTerms of every step to,
+            for logging, or None
+        :param logging_on: bool, whether or not to enable ERROR message logging
+        """
+        self.pi = picarx_obj
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.derivative_tau = derivative_tau
+        self.max_angle = max_angle
+        self.max_rate = max_rate
+        self.integral_limit = max_angle if integral_limit is None else integral_limit
+        self.terms_bus = terms_bus
+        self.logging = logging_on
+        if self.logging:
+            self.toggle_logging()
+        self.reset()
+
+    def toggle_logging(self):
+        if self.logging:
+            logging.getLogger().setLevel(logging.ERROR)
+            self.logging = False
+        else:
+            logging.getLogger().setLevel(logging.DEBUG)
+            self.logging = True
+
+    def reset(self):
+        """
+        Clears the controller state, e.g. when the line has been lost
+        """
+        self.integral = 0.0
+        self.derivative = 0.0
+        self.last_error = None
+        self.last_time = None
+        self.angle = 0.0
+        self.terms = None
+
+    @log_on_start(logging.DEBUG, "BEGIN SteeringController.steer")
+    @log_on_end(logging.DEBUG, "END SteeringController.steer")
+    @log_on_error(logging.ERROR, "ERROR SteeringController.steer {e!r}")
+    def steer(self, rel_line_pos, now=None):
+        """
+        Given relative line position, sets the steering towards the line
+        :param rel_line_pos: float [-1, 1] relative offset of the line from
+            the PiCar (positive values indicate line is to the right), or
+            None if the line is lost, which stops the car
+        :param now: float, time.monotonic() of the reading, now if None
+        :return: float, steering angle, or None if the line is lost
+        """
+        if rel_line_pos is None:
+            self.pi.stop()
+            self.reset()
+            return None
+
+        self.update(rel_line_pos, now)
+        self.pi.set_dir_servo_angle(self.angle)
+        return self.angle
+
+    def update(self, error, now=None):
+        """
+        Runs one step of the controller without touching the car
+        :param error: float, relative line position
+        :param now: float, time.monotonic() of the reading, now if None
+        :return: PIDTerms of the step
+        """
+        now = time.monotonic() if now is None else now
+        dt = 0.0 if self.last_time is None else now - self.last_time
+
+        # Filtered derivative of the error; nothing to differentiate on the
+        # first step, or if two readings share a timestamp
+        if dt > 0 and self.last_error is not None:
+            raw_derivative = (error - self.last_error) / dt
+            self.derivative += dt / (self.derivative_tau + dt) * (raw_derivative - self.derivative)
+
+        p = self.kp * error
+        d = self.kd * self.derivative
+        unclamped = p + self.ki * self.integral + d
+
+        # Anti-windup: only integrate when the output is not saturated, or
+        # when integrating would pull it back out of saturation
+        saturated = abs(unclamped) >= self.max_angle
+        if self.ki and dt > 0 and (not saturated or error * unclamped < 0):
+            self.integral += error * dt
+            limit = self.integral_limit / abs(self.ki)
+            self.integral = max(-limit, min(limit, self.integral))
+        i = self.ki * self.integral
+
+        output = max(-self.max_angle, min(self.max_angle, p + i + d))
+
+        # Rate limit the steering so the servo is not slammed across
+        if self.last_time is not None:
+            max_step = self.max_rate * dt
+            output = max(self.angle - max_step, min(self.angle + max_step, output))
+
+        self.angle = output
+        self.last_error = error
+        self.last_time = now
+        self.terms = PIDTerms(error, p, i, d, output, saturated, dt)
+        if self.terms_bus is not None:
+            self.terms_bus.set_message(self.terms, 'SteeringController')
+        return self.terms
+
+
+class SpeedPlanner:
+    def __init__(self, picarx_obj=None, max_speed=60, min_speed=20, curve_offset=0.5,
+                 history=0.3, stop_distance=10, slow_distance=60, stopping_time=1.0,
+                 max_accel=80, max_decel=200, logging_on=False):
+        """
+        Chooses the driving speed from how curved the line ahead looks and
+        how close obstacles are, instead of one fixed speed for the whole
+        track. drive() can be used as the function of a rossros
+        ConsumerProducer reading the line position, filtered distance and
+        steering busses:
+
+            ConsumerProducer(planner.drive, (line_bus, distance_bus, steering_bus),
+                             speed_bus, delay=0.02, schedule='rate')
+
+        The curvature is estimated from the recent line positions: the line
+        stays off-centre through curves, and moves quickly across the
+        sensors entering them.
+
+        :param picarx_obj: PiCarX object to drive, or None to only plan
+        :param max_speed: float, speed on straights with nothing ahead
+        :param min_speed: float, speed in the tightest curves
+        :param curve_offset: float, mean absolute line position over the
+            history at which the speed is brought down to min_speed
+        :param history: float, seconds of line positions to look back over
+        :param stop_distance: float, cm, distance at which to stop
+        :param slow_distance: float, cm, distance below which to slow down
+        :param stopping_time: float, time-to-collision (s) at which to stop,
+            when given DistanceEstimates
+        :param max_accel: float, largest speed increase per second
+        :param max_decel: float, largest speed decrease per second
+        :param logging_on: bool, whether or not to enable ERROR message logging
+        """
+        self.pi = picarx_obj
+        self.max_speed = max_speed
+        self.min_speed = min_speed
+        self.curve_offset = curve_offset
+        self.history = history
+        self.stop_distance = stop_distance
+        self.slow_distance = slow_distance
+        self.stopping_time = stopping_time
+        self.max_accel = max_accel
+        self.max_decel = max_decel
+        self.logging = logging_on
+        if self.logging:
+            self.toggle_logging()
+        self.positions = deque()
+        self.speed = 0.0
+        self.last_time = None
+
+    def toggle_logging(self):
+        if self.logging:
+            logging.getLogger().setLevel(logging.ERROR)
+            self.logging = False
+        else:
+            logging.getLogger().setLevel(logging.DEBUG)
+            self.logging = True
+
+    def curve_speed(self, rel_line_pos, now):
+        """
+        :return: float, speed the line's recent positions allow
+        """
+        self.positions.append((now, rel_line_pos))
+        while now - self.positions[0][0] > self.history:
+            self.positions.popleft()
+
+        mean_offset = sum(abs(p) for _, p in self.positions) / len(self.positions)
+        sweep = abs(self.positions[-1][1] - self.positions[0][1])
+        curvature = min(1.0, max(mean_offset, sweep) / self.curve_offset)
+        return self.max_speed - (self.max_speed - self.min_speed) * curvature
+
+    def obstacle_speed(self, distance):
+        """
+        :param distance: float distance in cm, DistanceEstimate, or None
+            if nothing is in range
+        :return: float, speed the obstacle ahead allows. A faulted sensor
+            (a raw -2, ECHO_STUCK, or a 'fault' estimate with no distance)
+            stops the car, since the road ahead is unknown
+        """
+        ttc = None
+        if hasattr(distance, 'ttc'):
+            if distance.distance is None and distance.status == 'fault':
+                return 0.0
+            distance, ttc = distance.distance, distance.ttc
+        elif distance == -2:
+            return 0.0
+        if distance is None or distance < 0:
+            return self.max_speed
+        if distance <= self.stop_distance or (ttc is not None and ttc <= self.stopping_time):
+            return 0.0
+        fraction = (distance - self.stop_distance) / (self.slow_distance - self.stop_distance)
+        return self.max_speed * min(1.0, fraction)
+
+    @log_on_start(logging.DEBUG, "BEGIN SpeedPlanner.plan")
+    @log_on_end(logging.DEBUG, "END SpeedPlanner.plan")
+    @log_on_error(logging.ERROR, "ERROR SpeedPlanner.plan {e!r}")
+    def plan(self, rel_line_pos, distance=None, now=None):
+        """
+        Updates the planned speed
+        :param rel_line_pos: float [-1, 1], relative line position, or None
+            if the line is lost, which stops the car
+        :param distance: float cm, DistanceEstimate, or None
+        :param now: float, time.monotonic() of the readings, now if None
+        :return: float, speed to drive at
+        """
+        now = time.monotonic() if now is None else now
+        dt = 0.0 if self.last_time is None else now - self.last_time
+        self.last_time = now
+
+        if rel_line_pos is None:
+            self.positions.clear()
+            self.speed = 0.0
+            return self.speed
+
+        target = min(self.curve_speed(rel_line_pos, now), self.obstacle_speed(distance))
+
+        # Braking for an obstacle that has to be stopped for is never limited
+        if target == 0.0:
+            self.speed = 0.0
+        else:
+            change = target - self.speed
+            self.speed += max(-self.max_decel * dt, min(self.max_accel * dt, change))
+        return self.speed
+
+    def drive(self, rel_line_pos, distance=None, steering_angle=0):
+        """
+        Plans the speed and drives the car forwards at it, or only plans it
+        if the planner has no PiCarX
+        :param steering_angle: float, current steering angle, for the
+            differential drive of PiCarX.forward
+        :return: float, speed driven at
+        """
+        speed = self.plan(rel_line_pos, distance)
+        if self.pi is not None:
+            if speed == 0.0:
+                self.pi.stop()
+            else:
+                self.pi.forward(speed, turn_angle=steering_angle or 0)
+        return speed
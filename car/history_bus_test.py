@@ -0,0 +1,101 @@
+"""
+history_bus_test.py
+
+Checks that a HistoryBus's read_filter reaches the nodes that read it
+through get_snapshot: the 'input' schedule, runCooperatively and the async
+nodes, as well as those that use get_message.
+
+    python3 -m pytest history_bus_test.py
+"""
+
+import asyncio
+import threading
+
+import numpy as np
+
+from adc_sampler import ADCSampler
+from rossros import Bus, Consumer, HistoryBus, runConcurrently, runCooperatively
+from rossros_async import AsyncConsumer, run_graph
+
+MESSAGES = ([10, 10, 10], [20, 20, 20], [30, 30, 30])
+MEAN = [20, 20, 20]  # of MESSAGES, the initial zeros are not part of the history
+
+
+def filled_bus():
+    bus = HistoryBus(np.zeros(3), name='history', shape=(3,), read_filter='mean', read_window=4)
+    for message in MESSAGES:
+        bus.set_message(message, 'test')
+    return bus
+
+
+def first_value(bus, schedule='input', executor=runConcurrently):
+    # Runs a consumer of bus until it has been called once, or for 2 s
+    done_bus = Bus(False, name='done')
+    received = []
+
+    def consume(value):
+        received.append(np.array(value))
+        done_bus.set_message(True, 'consumer')
+
+    consumer = Consumer(consume, bus, 0.01, done_bus, 'consumer', schedule=schedule)
+    watchdog = threading.Timer(2, done_bus.set_message, (True, 'watchdog'))
+    watchdog.start()
+    executor([consumer])
+    watchdog.cancel()
+    return received[0]
+
+
+def test_initial_message_is_not_history():
+    bus = HistoryBus(np.zeros(3), name='history', shape=(3,), read_filter='mean', read_window=4)
+    assert len(bus.last()) == 0
+    assert np.array_equal(bus.get_message('test'), np.zeros(3))
+    bus.set_message(MESSAGES[0], 'test')
+    assert np.array_equal(bus.get_message('test'), MESSAGES[0])
+
+
+def test_get_snapshot_is_filtered():
+    bus = filled_bus()
+    version, message = bus.get_snapshot('test')
+    assert version == len(MESSAGES)
+    assert np.array_equal(message, bus.get_message('test'))
+    assert np.array_equal(message, MEAN)
+
+
+def test_input_schedule_reads_filtered_value():
+    assert np.array_equal(first_value(filled_bus()), MEAN)
+
+
+def test_delay_schedule_reads_filtered_value():
+    assert np.array_equal(first_value(filled_bus(), schedule='delay'), MEAN)
+
+
+def test_cooperative_scheduler_reads_filtered_value():
+    assert np.array_equal(first_value(filled_bus(), executor=runCooperatively), MEAN)
+
+
+def test_async_consumer_reads_filtered_value():
+    bus = filled_bus()
+    done_bus = Bus(False, name='done')
+    received = []
+
+    def consume(value):
+        received.append(np.array(value))
+        done_bus.set_message(True, 'consumer')
+
+    consumer = AsyncConsumer(consume, bus, 0.01, done_bus, 'consumer', schedule='input')
+    asyncio.run(asyncio.wait_for(run_graph([consumer]), 2))
+    assert np.array_equal(received[0], MEAN)
+
+
+def test_adc_sampler_history_bus_is_filtered():
+    sampler = ADCSampler(rate=100, read_filter='median', read_window=3)
+    for message in ([1, 2, 3], [100, 200, 300], [4, 5, 6]):
+        sampler.history_bus.set_message(np.array(message), 'test')
+    assert np.array_equal(first_value(sampler.history_bus), [4, 5, 6])
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name, 'passed')
@@ -12,6 +12,7 @@ from logdecorator import log_on_start, log_on_end, log_on_error
 import math
 import numpy as np
 import time
+from collections import deque, namedtuple
 
 try:
     from ezblock import ADC
@@ -31,6 +32,17 @@ logging.basicConfig(format=logging_format, level=logging.INFO,
 
 
 STOPPING_DISTANCE = 5  # stopping distance for obstacles
+STOPPING_TIME = 1.0  # time-to-collision (s) below which to stop
+
+# Raw ultrasonic readings that are timeouts rather than distances
+NO_ECHO = -1  # echo never started, nothing in range or a lost ping
+ECHO_STUCK = -2  # echo never ended, sensor fault
+
+ADC_LEVELS = 4096  # the ADC is 12 bit
+GRAYSCALE_CALIBRATION_FILE = 'grayscale_calibration.npz'
+
+DistanceEstimate = namedtuple('DistanceEstimate',
+                              ['distance', 'closing_speed', 'ttc', 'status'])
 
 class UltrasonicInterpreter:
     def __init__(self, delay=500, logging_on=False):
@@ -83,6 +95,176 @@ class UltrasonicInterpreter:
             distance = self.obstacle_check(sensor_reading)
             control_bus.write(distance)
 
+    @log_on_start(logging.DEBUG, "BEGIN Interpreter.collision_check")
+    @log_on_end(logging.DEBUG, "END Interpreter.collision_check")
+    @log_on_error(logging.ERROR, "ERROR Interpreter.collision_check {e!r}")
+    def collision_check(self, estimate, stopping_time=STOPPING_TIME):
+        '''
+        Decides whether to stop from a filtered distance estimate, so the car
+        stops earlier when it is closing in faster
+
+        :param estimate: DistanceEstimate, from UltrasonicFilter
+        :param stopping_time: float, time-to-collision in seconds below
+            which to stop
+        :return: string, 'STOP' if the obstacle is within the stopping
+            distance or will be reached within stopping_time, or if the
+            sensor has faulted and the distance is unknown, empty string
+            otherwise (including when nothing is in range)
+        '''
+        if estimate.distance is None:
+            # A faulted sensor cannot tell an empty road from an obstacle
+            return 'STOP' if estimate.status == 'fault' else ''
+        if estimate.distance <= STOPPING_DISTANCE or estimate.ttc <= stopping_time:
+            return 'STOP'
+
+        return ''
+
+
+class UltrasonicFilter:
+    def __init__(self, window=5, max_speed=200, max_rejects=3, max_missed=3,
+                 alpha=0.5, beta=0.2, logging_on=False):
+        '''
+        Streaming filter for raw ultrasonic distances. Each reading is
+        gated against the distance predicted from the current closing
+        speed, and the median of the last accepted readings is tracked
+        with a constant-velocity (alpha-beta) estimate of its rate of
+        change, from which the time-to-collision follows.
+
+        Timeouts are not distances: NO_ECHO readings are counted as missed,
+        and ECHO_STUCK as faults. While fewer than max_missed timeouts in a
+        row have come in, the estimate is carried forward at the current
+        closing speed; after that the distance is unknown (None). If any of
+        those timeouts was a fault, the status stays 'fault' rather than
+        'unknown' until a distance is read again, so that a broken sensor
+        is not mistaken for nothing in range.
+
+        :param window: int, number of accepted readings the median is over
+        :param max_speed: float, cm/s, fastest the distance can plausibly
+            change; readings further than that from the prediction are
+            rejected as spurious echoes
+        :param max_rejects: int, rejections in a row after which the filter
+            restarts from the new readings, since the scene really changed
+        :param max_missed: int, timeouts in a row after which the distance
+            is unknown
+        :param alpha: float, (0, 1] weight of the position correction
+        :param beta: float, (0, 1] weight of the velocity correction
+        '''
+        self.logging = logging_on
+        if self.logging:
+            self.toggle_logging()
+        self.window = window
+        self.max_speed = max_speed
+        self.max_rejects = max_rejects
+        self.max_missed = max_missed
+        self.alpha = alpha
+        self.beta = beta
+        self.reset()
+
+    def toggle_logging(self):
+        if self.logging:
+            logging.getLogger().setLevel(logging.ERROR)
+            self.logging = False
+        else:
+            logging.getLogger().setLevel(logging.DEBUG)
+            self.logging = True
+
+    def reset(self):
+        '''
+        Forgets every reading, e.g. after the sensor has been pointed elsewhere
+        '''
+        self.samples = deque(maxlen=self.window)
+        self.distance = None
+        self.velocity = 0.0
+        self.last_time = None
+        self.missed = 0
+        self.missed_faults = 0  # faults among the current run of timeouts
+        self.rejected = 0
+        self.faults = 0
+
+    @log_on_start(logging.DEBUG, "BEGIN UltrasonicFilter.filter_distance")
+    @log_on_end(logging.DEBUG, "END UltrasonicFilter.filter_distance")
+    @log_on_error(logging.ERROR, "ERROR UltrasonicFilter.filter_distance {e!r}")
+    def filter_distance(self, reading, timestamp=None):
+        '''
+        Adds a raw reading to the filter
+
+        :param reading: float, distance in cm, or NO_ECHO/ECHO_STUCK
+        :param timestamp: float, time.monotonic() of the reading, now if None
+        :return: DistanceEstimate, with distance (cm, or None if unknown),
+            closing_speed (cm/s, positive when approaching), ttc (s, inf if
+            not approaching) and status ('ok', 'rejected', 'missed',
+            'fault' or 'unknown'). A 'fault' estimate with no distance means
+            the sensor has been failing for max_missed readings
+        '''
+        now = time.monotonic() if timestamp is None else timestamp
+        dt = 0.0 if self.last_time is None else now - self.last_time
+
+        if reading < 0:
+            if reading == ECHO_STUCK:
+                self.faults += 1
+                self.missed_faults += 1
+                status = 'fault'
+            else:
+                status = 'missed'
+            self.missed += 1
+            if self.missed >= self.max_missed:
+                self.reset_track()
+                status = 'fault' if self.missed_faults else 'unknown'
+            else:
+                self._predict(now, dt)
+            return self._estimate(status)
+
+        self.missed = 0
+        self.missed_faults = 0
+
+        # Gate the reading against where the obstacle should be by now
+        if self.distance is not None:
+            predicted = self.distance + self.velocity * dt
+            if abs(reading - predicted) > self.max_speed * max(dt, 0.01):
+                self.rejected += 1
+                if self.rejected < self.max_rejects:
+                    self._predict(now, dt)
+                    return self._estimate('rejected')
+                self.reset_track()
+
+        self.rejected = 0
+        self.samples.append(reading)
+        median = float(np.median(self.samples))
+
+        if self.distance is None:
+            self.distance = median
+            self.velocity = 0.0
+        else:
+            predicted = self.distance + self.velocity * dt
+            residual = median - predicted
+            self.distance = predicted + self.alpha * residual
+            if dt > 0:
+                self.velocity += self.beta * residual / dt
+        self.last_time = now
+
+        return self._estimate('ok')
+
+    def reset_track(self):
+        # Drop the readings and motion estimate, but keep the fault counts
+        self.samples.clear()
+        self.distance = None
+        self.velocity = 0.0
+        self.last_time = None
+        self.rejected = 0
+
+    def _predict(self, now, dt):
+        # Carry the estimate forward at the current closing speed
+        if self.distance is not None:
+            self.distance = max(0.0, self.distance + self.velocity * dt)
+            self.last_time = now
+
+    def _estimate(self, status):
+        if self.distance is None:
+            return DistanceEstimate(None, 0.0, math.inf, status)
+        closing_speed = -self.velocity
+        ttc = self.distance / closing_speed if closing_speed > 0 else math.inf
+        return DistanceEstimate(self.distance, closing_speed, ttc, status)
+
 
 class PhotoSensorInterpreter:
     def __init__(self, sensitivity=50, polarity=1, target=300,
@@ -145,6 +327,47 @@ class PhotoSensorInterpreter:
 
         return direction * offset
 
+    @log_on_start(logging.DEBUG, "BEGIN Interpreter.relative_line_positions")
+    @log_on_end(logging.DEBUG, "END Interpreter.relative_line_positions")
+    @log_on_error(logging.ERROR, "ERROR Interpreter.relative_line_positions {e!r}")
+    def relative_line_positions(self, adc_values):
+        '''
+        Batch version of relative_line_position, e.g. for a recorded ADC
+        stream, giving the same result for every row
+
+        :param adc_values: array-like, shape (N, 3), one ADC triple per row
+        :return: float array, shape (N,), relative direction to turn for each
+            row, NaN where relative_line_position returns None
+        '''
+        adc_values = np.asarray(adc_values)
+        if adc_values.ndim != 2 or adc_values.shape[1] != 3:
+            raise ValueError("ADC values should have shape (N, 3), not {0}".format(adc_values.shape))
+
+        # Same test as _sensor_sees_target, whose two conditions reduce to one
+        if self.polarity == 1:
+            sees = self.target > adc_values - self.sensitivity
+        else:
+            sees = self.target < adc_values - self.sensitivity
+        left, mid, right = sees[:, self.LEFT], sees[:, self.MID], sees[:, self.RIGHT]
+
+        # Target patterns that give each direction; any other pattern has no line
+        centre = (mid & (left == right))
+        to_left = left & ~right
+        to_right = right & ~left
+        direction = np.full(len(adc_values), np.nan)
+        direction[centre] = 0
+        direction[to_left] = -1
+        direction[to_right] = 1
+
+        # Average the differences of the sighting channels, summed in channel
+        # order as the scalar path does so the results match exactly
+        diffs = np.where(sees, np.abs(self.target - adc_values) / self.sensitivity, 0.0)
+        total = (diffs[:, self.LEFT] + diffs[:, self.MID]) + diffs[:, self.RIGHT]
+        count = np.maximum(sees.sum(axis=1), 1)
+        offset = np.minimum(1, total / count)
+
+        return direction * offset
+
     def consume_sensor_produce_control(self, sensor_bus, control_bus, delay):
         '''
         Reads sensor data from sensor_bus, processes data,
@@ -203,11 +426,400 @@ class PhotoSensorInterpreter:
                 return 0
 
 
+def sweep_photosensor_parameters(adc_values, labels, sensitivities, polarities=(1, -1),
+                                 targets=(300,)):
+    '''
+    Scores every combination of PhotoSensorInterpreter settings against a
+    labelled ADC trace, using the batch path
+
+    :param adc_values: array-like, shape (N, 3), recorded ADC triples
+    :param labels: array-like, shape (N,), expected relative line position
+        for each triple, NaN where no line should be found
+    :param sensitivities: iterable of sensitivity values to try
+    :param polarities: iterable of polarity values to try
+    :param targets: iterable of target values to try
+    :return: list of dicts, one per combination, best first: the settings,
+        'missed' (rows with a line that was not found), 'false' (rows
+        without a line where one was found) and 'mae' (mean absolute error
+        over the rows where both have a line, NaN if there are none)
+    '''
+    adc_values = np.asarray(adc_values)
+    labels = np.asarray(labels, dtype=float)
+    has_line = ~np.isnan(labels)
+
+    # One interpreter is reused, since only its settings change
+    interp = PhotoSensorInterpreter()
+    results = []
+    for sensitivity in sensitivities:
+        for polarity in polarities:
+            for target in targets:
+                interp.sensitivity = sensitivity
+                interp.polarity = polarity
+                interp.target = target
+                positions = interp.relative_line_positions(adc_values)
+                found = ~np.isnan(positions)
+                both = found & has_line
+                results.append({
+                    'sensitivity': sensitivity,
+                    'polarity': polarity,
+                    'target': target,
+                    'missed': int(np.sum(has_line & ~found)),
+                    'false': int(np.sum(found & ~has_line)),
+                    'mae': float(np.mean(np.abs(positions[both] - labels[both]))) if both.any() else math.nan,
+                })
+
+    # Rank by detection mistakes first, then by accuracy where both agree
+    results.sort(key=lambda r: (r['missed'] + r['false'],
+                                math.inf if math.isnan(r['mae']) else r['mae']))
+    return results
+
+
+class LineEstimator:
+    def __init__(self, calibration_file=None, min_weight=0.3, logging_on=False):
+        '''
+        Continuous line position from the three grayscale channels. Each
+        channel's reading is mapped through its own lookup table to how
+        much of the line it sees, from 0 (floor) to 1 (line), and the
+        position is the centroid of those weights over the channels'
+        positions (-1 left, 0 middle, 1 right), so it varies smoothly as
+        the line moves between sensors.
+
+        The tables are built by calibrate() from readings of a sweep over
+        the line and the floor, and kept in a small file with save().
+
+        :param calibration_file: str, file written by save() to load the
+            tables from, or None to start uncalibrated
+        :param min_weight: float, total weight below which no line is seen
+        '''
+        self.logging = logging_on
+        if self.logging:
+            self.toggle_logging()
+        self.min_weight = min_weight
+        self.line_levels = None
+        self.floor_levels = None
+        self.tables = None
+        if calibration_file is not None:
+            self.load(calibration_file)
+
+    def toggle_logging(self):
+        if self.logging:
+            logging.getLogger().setLevel(logging.ERROR)
+            self.logging = False
+        else:
+            logging.getLogger().setLevel(logging.DEBUG)
+            self.logging = True
+
+    def calibrate(self, adc_values, line_percentile=2, floor_percentile=98):
+        '''
+        Builds the lookup tables from readings taken while the sensors were
+        swept across the line, so that every channel saw both line and floor
+
+        :param adc_values: array-like, shape (N, 3), readings of the sweep
+        :param line_percentile: float, percentile of each channel's readings
+            taken as its level over the line (low percentiles for a dark
+            line, i.e. polarity 1)
+        :param floor_percentile: float, percentile taken as its level over
+            the floor. Swap the two for a line lighter than the floor
+        '''
+        adc_values = np.asarray(adc_values, dtype=float)
+        line_levels = np.percentile(adc_values, line_percentile, axis=0)
+        floor_levels = np.percentile(adc_values, floor_percentile, axis=0)
+        if np.any(line_levels == floor_levels):
+            raise ValueError("Calibration sweep did not cover both line and floor: "
+                             "line levels {0}, floor levels {1}".format(line_levels, floor_levels))
+        self._build_tables(line_levels, floor_levels)
+
+    def _build_tables(self, line_levels, floor_levels):
+        self.line_levels = np.asarray(line_levels, dtype=float)
+        self.floor_levels = np.asarray(floor_levels, dtype=float)
+        levels = np.arange(ADC_LEVELS)
+        tables = np.clip((levels[None, :] - self.floor_levels[:, None])
+                         / (self.line_levels - self.floor_levels)[:, None], 0, 1)
+
+        # Python lists, so that a lookup in the hot path is a plain index
+        # returning an existing float
+        self.tables = [table.tolist() for table in tables]
+
+    def save(self, calibration_file=GRAYSCALE_CALIBRATION_FILE):
+        '''
+        Writes the calibration levels and lookup tables to a file
+        '''
+        if self.tables is None:
+            raise ValueError("LineEstimator has not been calibrated, so there is nothing to save")
+        np.savez_compressed(calibration_file,
+                            line_levels=self.line_levels,
+                            floor_levels=self.floor_levels,
+                            tables=np.array(self.tables, dtype=np.float32))
+
+    def load(self, calibration_file=GRAYSCALE_CALIBRATION_FILE):
+        '''
+        Reads the calibration written by save()
+        '''
+        with np.load(calibration_file) as calibration:
+            self.line_levels = calibration['line_levels']
+            self.floor_levels = calibration['floor_levels']
+            self.tables = [table.tolist() for table in calibration['tables']]
+
+    def line_position(self, adc_values):
+        '''
+        Gets the position of the line relative to the PiCar
+
+        :param adc_values: sequence of three ADC readings (left, middle, right)
+        :return: float in [-1, 1], negative when the line is to the left, or
+            None if no channel sees enough of the line
+        '''
+        top = ADC_LEVELS - 1
+        left_table, mid_table, right_table = self.tables
+        left = left_table[min(max(int(adc_values[0]), 0), top)]
+        mid = mid_table[min(max(int(adc_values[1]), 0), top)]
+        right = right_table[min(max(int(adc_values[2]), 0), top)]
+
+        total = left + mid + right
+        if total < self.min_weight:
+            return None
+        return (right - left) / total
+
+
+class LanePipeline:
+    def __init__(self, lower_hsv=(50, 80, 20), upper_hsv=(100, 120, 50),
+                 roi=((0, 0.5), (1, 0.5), (1, 1), (0, 1)), canny_thresholds=(200, 400),
+                 hough_threshold=10, min_line_length=8, max_line_gap=4):
+        """
+        Lane line segment detection that only processes the region of
+        interest. The frame is cropped to the ROI's bounding box before the
+        colour conversion, so pixels outside it are never touched, and the
+        intermediate images are written into scratch buffers that are kept
+        between frames. Buffers and the ROI mask are made once per frame
+        resolution; when the ROI fills its bounding box, as the default
+        lower half does, no mask is applied at all.
+
+        :param lower_hsv: HSV lower bound of the line colour
+        :param upper_hsv: HSV upper bound of the line colour
+        :param roi: polygon of the region of interest, as (x, y) fractions
+            of the frame width and height
+        :param canny_thresholds: tuple, Canny hysteresis thresholds
+        :param hough_threshold: int, HoughLinesP accumulator threshold
+        :param min_line_length: int, HoughLinesP minimum segment length
+        :param max_line_gap: int, HoughLinesP maximum gap within a segment
+        """
+        self.lower_hsv = np.array(lower_hsv, dtype=np.uint8)
+        self.upper_hsv = np.array(upper_hsv, dtype=np.uint8)
+        self.roi = roi
+        self.canny_thresholds = canny_thresholds
+        self.hough_threshold = hough_threshold
+        self.min_line_length = min_line_length
+        self.max_line_gap = max_line_gap
+        self._scratch = {}
+
+    def _buffers(self, height, width):
+        # Crop bounds, scratch images and ROI mask for one frame resolution
+        key = (height, width)
+        if key not in self._scratch:
+            polygon = np.array([(x * width, y * height) for x, y in self.roi], np.int32)
+            left, top = polygon.min(axis=0)
+            right, bottom = polygon.max(axis=0)
+            right, bottom = min(right, width), min(bottom, height)
+            size = (bottom - top, right - left)
+
+            roi_mask = np.zeros(size, np.uint8)
+            cv2.fillPoly(roi_mask, [polygon - (left, top)], 255)
+            if roi_mask.all():
+                roi_mask = None
+
+            self._scratch[key] = {
+                'crop': (top, bottom, left, right),
+                'offset': np.array([left, top, left, top], np.int32),
+                'hsv': np.empty(size + (3,), np.uint8),
+                'mask': np.empty(size, np.uint8),
+                'edges': np.empty(size, np.uint8),
+                'roi_mask': roi_mask,
+            }
+        return self._scratch[key]
+
+    def line_segments(self, frame):
+        """
+        Gets detected line segments from frame
+        :param frame: matrix of BGR values
+        :return: array of line segments, shape (N, 1, 4), in frame
+            coordinates, or None if there are none
+        """
+        height, width = frame.shape[:2]
+        scratch = self._buffers(height, width)
+        top, bottom, left, right = scratch['crop']
+
+        hsv = cv2.cvtColor(frame[top:bottom, left:right], cv2.COLOR_BGR2HSV, dst=scratch['hsv'])
+        mask = cv2.inRange(hsv, self.lower_hsv, self.upper_hsv, dst=scratch['mask'])
+        edges = cv2.Canny(mask, *self.canny_thresholds, edges=scratch['edges'])
+        if scratch['roi_mask'] is not None:
+            cv2.bitwise_and(edges, scratch['roi_mask'], dst=edges)
+
+        line_segments = cv2.HoughLinesP(edges, 1, np.pi / 180, self.hough_threshold,
+                                        None, minLineLength=self.min_line_length,
+                                        maxLineGap=self.max_line_gap)
+        if line_segments is None:
+            return None
+        # OpenCV 5 returns (N, 4) rather than (N, 1, 4)
+        return line_segments.reshape(-1, 1, 4) + scratch['offset']
+
+
+class LaneTracker:
+    def __init__(self, pipeline, fit_lanes, band=16, rows=16, min_support=0.6,
+                 max_tracked_frames=30, alpha=0.5, beta=0.1, logging_on=False):
+        """
+        Tracks the left and right lane lines across frames, so that the Hough
+        transform only runs when the lanes have to be found again. Each lane
+        is kept as x = a * y + b in frame coordinates (lane lines are closer
+        to vertical than horizontal) with a constant-velocity (alpha-beta)
+        estimate of how a and b change per frame.
+
+        On a tracked frame, a few rows of the region of interest are checked
+        for the lane colour only within band pixels of each predicted lane,
+        and a line is fitted through the centres of the matches. A lane is
+        confirmed when at least min_support of the rows have a match. When
+        a lane is not confirmed, when none are tracked, or after
+        max_tracked_frames tracked frames in a row (to pick up a lane that
+        came into view), the frame falls back to the full detection: the
+        pipeline's Hough segments, averaged into lanes by fit_lanes.
+
+        :param pipeline: LanePipeline, gives the colour range and region of
+            interest, and the segments on fallback frames
+        :param fit_lanes: function of (frame, line_segments) returning the
+            (slope, intercept) of the left and right lanes, None for a
+            missing lane, as ColorInterpreter._fit_lanes does
+        :param band: int, pixels either side of a predicted lane searched
+        :param rows: int, number of rows of the region of interest searched
+        :param min_support: float, (0, 1] fraction of the rows that must
+            match for a lane to be confirmed
+        :param max_tracked_frames: int, frames tracked before detecting anew
+        :param alpha: float, (0, 1] weight of the lane position correction
+        :param beta: float, (0, 1] weight of the lane motion correction
+        """
+        self.logging = logging_on
+        if self.logging:
+            self.toggle_logging()
+        self.pipeline = pipeline
+        self.fit_lanes = fit_lanes
+        self.offsets = np.arange(-band, band + 1)
+        self.rows = rows
+        self.min_support = min_support
+        self.max_tracked_frames = max_tracked_frames
+        self.alpha = alpha
+        self.beta = beta
+        self.frames = 0
+        self.fallbacks = 0
+        self.reset()
+
+    def toggle_logging(self):
+        if self.logging:
+            logging.getLogger().setLevel(logging.ERROR)
+            self.logging = False
+        else:
+            logging.getLogger().setLevel(logging.DEBUG)
+            self.logging = True
+
+    def reset(self):
+        """
+        Forgets the tracked lanes, so the next frame is detected in full
+        """
+        # Per side: None, or [array (a, b), array (da, db) per frame]
+        self.lanes = [None, None]
+        self.tracked_frames = 0
+
+    @property
+    def fallback_rate(self):
+        """
+        :return: float, fraction of the frames so far that needed the full
+            detection
+        """
+        return self.fallbacks / self.frames if self.frames else 0.0
+
+    @log_on_start(logging.DEBUG, "BEGIN LaneTracker.lane_lines")
+    @log_on_end(logging.DEBUG, "END LaneTracker.lane_lines")
+    @log_on_error(logging.ERROR, "ERROR LaneTracker.lane_lines {e!r}")
+    def lane_lines(self, frame):
+        """
+        Updates the lanes from frame
+        :param frame: matrix of BGR values
+        :return: list of lane lines, left before right, each [[x1, y1, x2,
+            y2]] from the bottom to the middle of the frame, as
+            ColorInterpreter._average_slope_intercept returns them
+        """
+        self.frames += 1
+        height, width = frame.shape[:2]
+        tracking = any(lane is not None for lane in self.lanes)
+
+        if tracking and self.tracked_frames < self.max_tracked_frames:
+            measured = [None if lane is None else self._search(frame, lane[0] + lane[1])
+                        for lane in self.lanes]
+            if all(m is not None for m, lane in zip(measured, self.lanes) if lane is not None):
+                self.tracked_frames += 1
+                self._update(measured)
+                return self._lane_points(height, width)
+
+        # Lost a lane or due for a fresh look: run the full detection
+        self.fallbacks += 1
+        self.tracked_frames = 0
+        measured = []
+        for fit in self.fit_lanes(frame, self.pipeline.line_segments(frame)):
+            slope, intercept = (0, 0) if fit is None else fit
+            measured.append(None if slope == 0 else np.array([1 / slope, -intercept / slope]))
+        self._update(measured)
+        return self._lane_points(height, width)
+
+    def _search(self, frame, predicted):
+        # Fit x = a * y + b through the lane colour within the band around
+        # the predicted lane, on evenly spaced rows of the region of interest
+        height, width = frame.shape[:2]
+        top, bottom, _, _ = self.pipeline._buffers(height, width)['crop']
+        ys = np.linspace(top, bottom - 1, self.rows).astype(int)
+        xs = np.rint(predicted[0] * ys + predicted[1]).astype(int)[:, None] + self.offsets
+        inside = (xs >= 0) & (xs < width)
+        np.clip(xs, 0, width - 1, out=xs)
+
+        hsv = cv2.cvtColor(frame[ys[:, None], xs], cv2.COLOR_BGR2HSV)
+        matches = (cv2.inRange(hsv, self.pipeline.lower_hsv, self.pipeline.upper_hsv) > 0) & inside
+        counts = matches.sum(axis=1)
+        hits = counts > 0
+        if hits.mean() < self.min_support:
+            return None
+        centres = (matches * xs).sum(axis=1)[hits] / counts[hits]
+        return np.polyfit(ys[hits], centres, 1)
+
+    def _update(self, measured):
+        for side, m in enumerate(measured):
+            lane = self.lanes[side]
+            if m is None:
+                self.lanes[side] = None
+            elif lane is None:
+                self.lanes[side] = [m, np.zeros(2)]
+            else:
+                predicted = lane[0] + lane[1]
+                residual = m - predicted
+                lane[0] = predicted + self.alpha * residual
+                lane[1] = lane[1] + self.beta * residual
+
+    def _lane_points(self, height, width):
+        # End points from the bottom to the middle of the frame, bounded as
+        # in ColorInterpreter._make_points
+        lane_lines = []
+        for lane in self.lanes:
+            if lane is not None:
+                a, b = lane[0]
+                y1 = height
+                y2 = int(y1 * 1 / 2)
+                x1 = max(-width, min(2 * width, int(a * y1 + b)))
+                x2 = max(-width, min(2 * width, int(a * y2 + b)))
+                lane_lines.append([[x1, y1, x2, y2]])
+        return lane_lines
+
+
 class ColorInterpreter:
     def __init__(self, logging_on=False):
         self.logging = logging_on
         if self.logging:
             self.toggle_logging()
+        self.lane_pipeline = LanePipeline()
+        self.lane_tracker = LaneTracker(self.lane_pipeline, self._fit_lanes)
 
     def toggle_logging(self):
         if self.logging:
@@ -227,14 +839,20 @@ class ColorInterpreter:
         :param frame: matrix of RGB values
         :return: int, angle to turn towards
         """
-        lane_lines = self._get_line_segments(frame)
+        lane_lines = self.lane_tracker.lane_lines(frame)
         # return None if no lanes detected
         if len(lane_lines) == 0:
             return None
         height, width, _ = frame.shape
-        lane_line = lane_lines[0]  # only using first line
-        x1, _, x2, _ = lane_line
-        x_offset = (x2 - x1)
+        if len(lane_lines) == 1:
+            # follow the direction of the one lane
+            x1, _, x2, _ = lane_lines[0][0]
+            x_offset = x2 - x1
+        else:
+            # head for the middle of the two lanes
+            _, _, left_x2, _ = lane_lines[0][0]
+            _, _, right_x2, _ = lane_lines[1][0]
+            x_offset = (left_x2 + right_x2) / 2 - width / 2
         y_offset = int(height / 2)
 
         angle_to_mid_radian = math.atan(x_offset / y_offset)
@@ -270,34 +888,7 @@ class ColorInterpreter:
         :param frame: matrix of RGB values
         :return: list of line segments
         """
-        # extract HSV values from RGB values in frame
-        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-
-        # TODO: move hardcoded values to class constants or parameters
-        # create mask for line
-        mask = cv2.inRange(hsv,
-                           np.array([50, 80, 20]),
-                           np.array([100, 120, 50]))
-
-        # edge detection
-        edges = cv2.Canny(mask, 200, 400)
-
-        # crop edges
-        height, width = edges.shape
-        fill_mask = np.zeros_like(edges)
-        polygon = np.array([[(0, 0.5 * height),
-                             (width, 0.5 * height),
-                             (width, height),
-                             (0, height)]], np.int32)
-        cv2.fillPoly(fill_mask, polygon, 255)
-        cropped_edges = cv2.bitwise_and(edges, fill_mask)
-
-        # Apply Hough transform to edgest to get line segments
-        line_segments = cv2.HoughLinesP(cropped_edges, 1, np.pi / 180, 10,
-                                        np.array([]), minLineLength=8,
-                                        maxLineGap=4)
-
-        return line_segments
+        return self.lane_pipeline.line_segments(frame)
 
     @log_on_error(logging.ERROR, "ERROR Interpreter._get_line_segments {e!r}")
     def _make_points(self, frame, line):
@@ -310,10 +901,19 @@ class ColorInterpreter:
         y2 = int(y1 * 1 / 2)  # make points from middle of the frame down
 
         # bound the coordinates within the frame
-        x1 = max(-width, min(2 * width, int((y1 - intercept) / slope)))
-        x2 = max(-width, min(2 * width, int((y2 - intercept) / slope)))
+        x1 = self._bounded_x(y1, slope, intercept, width)
+        x2 = self._bounded_x(y2, slope, intercept, width)
         return [[x1, y1, x2, y2]]
 
+    @staticmethod
+    def _bounded_x(y, slope, intercept, width):
+        # x of the line at y, bounded to [-width, 2 * width]. A horizontal
+        # segment fits a slope of 0, which np.polyfit used to give as about
+        # +1e-16: its line runs off to the bound on the side of y
+        if slope == 0:
+            return 0 if y == intercept else (2 * width if y > intercept else -width)
+        return max(-width, min(2 * width, int((y - intercept) / slope)))
+
     @log_on_error(logging.ERROR, "ERROR Interpreter._get_avg_slope_intercept {e!r}")
     def _average_slope_intercept(self, frame, line_segments):
         """
@@ -322,39 +922,40 @@ class ColorInterpreter:
         If all line slopes are > 0: then we only have detected right lane
         """
         lane_lines = []
+        for fit in self._fit_lanes(frame, line_segments):
+            if fit is not None:
+                lane_lines.append(self._make_points(frame, fit))
+
+        return lane_lines
+
+    @log_on_error(logging.ERROR, "ERROR Interpreter._fit_lanes {e!r}")
+    def _fit_lanes(self, frame, line_segments):
+        """
+        Averages line segments into the left and right lane lines
+        :return: tuple, (slope, intercept) of the left and of the right
+            lane, None for a lane without segments
+        """
         if line_segments is None:
             logging.info('No line_segment segments detected')
-            return lane_lines
+            return None, None
 
         height, width, _ = frame.shape
-        left_fit = []
-        right_fit = []
-
         boundary = 1 / 3
         left_region_boundary = width * (
         1 - boundary)  # left lane line segment should be on left 2/3 of the screen
         right_region_boundary = width * boundary  # right lane line segment should be on left 2/3 of the screen
 
-        for line_segment in line_segments:
-            for x1, y1, x2, y2 in line_segment:
-                if x1 == x2:
-                    continue
-                fit = np.polyfit((x1, x2), (y1, y2), 1)
-                slope = fit[0]
-                intercept = fit[1]
-                if slope < 0:
-                    if x1 < left_region_boundary and x2 < left_region_boundary:
-                        left_fit.append((slope, intercept))
-                else:
-                    if x1 > right_region_boundary and x2 > right_region_boundary:
-                        right_fit.append((slope, intercept))
-
-        left_fit_average = np.average(left_fit, axis=0)
-        if len(left_fit) > 0:
-            lane_lines.append(self._make_points(frame, left_fit_average))
-
-        right_fit_average = np.average(right_fit, axis=0)
-        if len(right_fit) > 0:
-            lane_lines.append(self._make_points(frame, right_fit_average))
+        # The line through a segment's two end points, for all segments at
+        # once; vertical segments have no slope and are left out
+        x1, y1, x2, y2 = np.asarray(line_segments, dtype=float).reshape(-1, 4).T
+        dx = x2 - x1
+        fitted = dx != 0
+        slopes = np.divide(y2 - y1, dx, out=np.zeros_like(dx), where=fitted)
+        intercepts = y1 - slopes * x1
 
-        return lane_lines
+        left = fitted & (slopes < 0) & (x1 < left_region_boundary) & (x2 < left_region_boundary)
+        right = fitted & (slopes >= 0) & (x1 > right_region_boundary) & (x2 > right_region_boundary)
+
+        left_fit_average = np.array([slopes[left].mean(), intercepts[left].mean()]) if left.any() else None
+        right_fit_average = np.array([slopes[right].mean(), intercepts[right].mean()]) if right.any() else None
+        return left_fit_average, right_fit_average
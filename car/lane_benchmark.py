@@ -0,0 +1,130 @@
+"""
+lane_benchmark.py
+
+Times lane detection per frame, from a frame to its averaged lane lines:
+with the original full-frame pipeline (kept here as
+full_frame_line_segments), with LanePipeline, and with the LaneTracker that
+ColorInterpreter steers by, which only runs the Hough transform when it
+loses the lanes. Frames are processed in order, as a video would be.
+
+    python3 lane_benchmark.py [folder of frames] [--repeat N]
+
+Every image in the folder is used; without a folder, synthetic 640x480
+frames with lane lines in the detected colour are generated.
+
+HoughLinesP samples edge pixels in a pseudo-random order, so a handful of
+edge pixels differing at the crop border is enough to change the individual
+segments. The pipelines are compared on the lane lines that
+ColorInterpreter._average_slope_intercept makes of the segments instead,
+against the lanes of the full-frame pipeline.
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from interpreter_class import ColorInterpreter, LanePipeline
+
+IMAGE_PATTERNS = ('*.png', '*.jpg', '*.jpeg', '*.bmp')
+
+
+def full_frame_line_segments(frame):
+    """
+    ColorInterpreter._get_line_segments as it was before LanePipeline:
+    converts and edge-detects the whole frame, then masks off the top half
+    """
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    mask = cv2.inRange(hsv, np.array([50, 80, 20]), np.array([100, 120, 50]))
+    edges = cv2.Canny(mask, 200, 400)
+    height, width = edges.shape
+    fill_mask = np.zeros_like(edges)
+    polygon = np.array([[(0, 0.5 * height), (width, 0.5 * height),
+                         (width, height), (0, height)]], np.int32)
+    cv2.fillPoly(fill_mask, polygon, 255)
+    cropped_edges = cv2.bitwise_and(edges, fill_mask)
+    line_segments = cv2.HoughLinesP(cropped_edges, 1, np.pi / 180, 10, np.array([]),
+                                    minLineLength=8, maxLineGap=4)
+    return None if line_segments is None else line_segments.reshape(-1, 1, 4)
+
+
+def synthetic_frames(count=60, size=(480, 640), seed=0):
+    """
+    :return: list of BGR frames of a noisy floor with two lane lines in the
+        colour LanePipeline looks for, wandering from frame to frame
+    """
+    rng = np.random.default_rng(seed)
+    height, width = size
+    line_colour = cv2.cvtColor(np.uint8([[[75, 100, 35]]]), cv2.COLOR_HSV2BGR)[0, 0].tolist()
+    frames = []
+    for i in range(count):
+        frame = rng.integers(150, 220, (height, width, 3), dtype=np.uint8)
+        shift = int(40 * np.sin(i / 10))
+        cv2.line(frame, (width // 4 + shift, height), (width // 2 - 40 + shift, height // 3),
+                 line_colour, 6)
+        cv2.line(frame, (3 * width // 4 + shift, height), (width // 2 + 40 + shift, height // 3),
+                 line_colour, 6)
+        frames.append(frame)
+    return frames
+
+
+def load_frames(folder):
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(folder, pattern)))
+    frames = [cv2.imread(p) for p in paths]
+    return [f for f in frames if f is not None]
+
+
+def ms_per_frame(detect, frames, repeat):
+    detect(frames[0])  # warm up, e.g. LanePipeline's buffers
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            detect(frame)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(frames))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='lane detection benchmark')
+    parser.add_argument('folder', nargs='?', help='folder of sample frames (default: synthetic)')
+    parser.add_argument('--repeat', type=int, default=5, help='passes over the frames')
+    args = parser.parse_args()
+
+    frames = load_frames(args.folder) if args.folder else synthetic_frames()
+    if not frames:
+        parser.error('no images found in {}'.format(args.folder))
+
+    interpreter = ColorInterpreter()
+    pipeline = LanePipeline()
+    runs = [('full frame', lambda f: interpreter._average_slope_intercept(f, full_frame_line_segments(f))),
+            ('ROI', lambda f: interpreter._average_slope_intercept(f, pipeline.line_segments(f))),
+            ('tracked', interpreter.lane_tracker.lane_lines)]
+
+    height, width = frames[0].shape[:2]
+    print('{} frames of {}x{}'.format(len(frames), width, height))
+    print('{:>12s} {:>10s} {:>16s}'.format('pipeline', 'ms/frame', 'max lane error'))
+    reference = [runs[0][1](frame) for frame in frames]
+    for name, detect in runs:
+        ms = ms_per_frame(detect, frames, args.repeat)
+        interpreter.lane_tracker.reset()
+        error = max(lane_error(lanes, detect(frame)) for lanes, frame in zip(reference, frames))
+        print('{:>12s} {:>10.3f} {:>13.0f} px'.format(name, ms, error))
+    tracker = interpreter.lane_tracker
+    print('tracker fell back to the Hough transform on {} of {} frames ({:.1%})'.format(
+        tracker.fallbacks, tracker.frames, tracker.fallback_rate))
+
+
+def lane_error(lanes, other_lanes):
+    # Largest end point difference between two sets of lane lines, inf
+    # when they found different numbers of lanes
+    if len(lanes) != len(other_lanes):
+        return np.inf
+    if not lanes:
+        return 0
+    return np.abs(np.array(lanes) - np.array(other_lanes)).max()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+lane_fit_benchmark.py
+
+Times ColorInterpreter._fit_lanes, which averages Hough line segments into
+the left and right lane lines, against the per-segment loop it replaced
+(kept here as looped_fit_lanes), for 10 to 2000 random segments in a
+640x480 frame, and checks that both give the same lanes.
+
+    python3 lane_fit_benchmark.py [--repeat N]
+
+The loop fitted each segment with np.polyfit, which gives horizontal
+segments a slope of about +-1e-16 rather than 0, so it put them on a
+random side. They are left out of the random segments here; the
+vectorized fit puts them on the right, as a slope of 0.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from interpreter_class import ColorInterpreter
+
+FRAME = np.zeros((480, 640, 3), np.uint8)
+SEGMENT_COUNTS = (10, 30, 100, 300, 1000, 2000)
+
+
+def looped_fit_lanes(frame, line_segments):
+    """
+    ColorInterpreter._fit_lanes as it was before it was vectorized
+    """
+    if line_segments is None:
+        return None, None
+
+    height, width, _ = frame.shape
+    left_fit = []
+    right_fit = []
+
+    boundary = 1 / 3
+    left_region_boundary = width * (1 - boundary)
+    right_region_boundary = width * boundary
+
+    for line_segment in line_segments:
+        for x1, y1, x2, y2 in line_segment:
+            if x1 == x2:
+                continue
+            fit = np.polyfit((x1, x2), (y1, y2), 1)
+            slope = fit[0]
+            intercept = fit[1]
+            if slope < 0:
+                if x1 < left_region_boundary and x2 < left_region_boundary:
+                    left_fit.append((slope, intercept))
+            else:
+                if x1 > right_region_boundary and x2 > right_region_boundary:
+                    right_fit.append((slope, intercept))
+
+    left_fit_average = np.average(left_fit, axis=0) if len(left_fit) > 0 else None
+    right_fit_average = np.average(right_fit, axis=0) if len(right_fit) > 0 else None
+    return left_fit_average, right_fit_average
+
+
+def random_segments(count, seed=0):
+    """
+    :return: array of count segments, shape (count, 1, 4) as HoughLinesP
+        gives them, with some vertical ones but no horizontal ones
+    """
+    rng = np.random.default_rng(seed)
+    height, width, _ = FRAME.shape
+    segments = np.column_stack([rng.integers(0, width, count), rng.integers(0, height, count),
+                                rng.integers(0, width, count), rng.integers(0, height, count)])
+    segments[::7, 2] = segments[::7, 0]
+    horizontal = segments[:, 1] == segments[:, 3]
+    segments[horizontal, 3] = (segments[horizontal, 3] + 1) % height
+    return segments.reshape(-1, 1, 4).astype(np.int32)
+
+
+def same_fits(fits, other_fits):
+    for fit, other in zip(fits, other_fits):
+        if (fit is None) != (other is None):
+            return False
+        if fit is not None and not np.allclose(fit, other, rtol=1e-9, atol=1e-9):
+            return False
+    return True
+
+
+def ms_per_call(fit_lanes, segments, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fit_lanes(FRAME, segments)
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='lane fit benchmark')
+    parser.add_argument('--repeat', type=int, default=20, help='calls timed per segment count')
+    args = parser.parse_args()
+
+    interpreter = ColorInterpreter()
+    print('{:>9s} {:>10s} {:>13s} {:>9s} {:>6s}'.format('segments', 'loop ms', 'vectorized ms',
+                                                         'speedup', 'same'))
+    for count in SEGMENT_COUNTS:
+        segments = random_segments(count)
+        looped = ms_per_call(looped_fit_lanes, segments, args.repeat)
+        vectorized = ms_per_call(interpreter._fit_lanes, segments, args.repeat)
+        same = same_fits(looped_fit_lanes(FRAME, segments), interpreter._fit_lanes(FRAME, segments))
+        print('{:>9d} {:>10.3f} {:>13.3f} {:>8.1f}x {:>6s}'.format(count, looped, vectorized,
+                                                                     looped / vectorized, str(same)))
+
+
+if __name__ == '__main__':
+    main()
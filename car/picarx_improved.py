@@ -13,6 +13,8 @@ except ImportError:
           'is not present). Shadowing hardware call swith substitute functions')
     from sim_ezblock import *
 
+from adc_group import ADCGroup
+
 '''BEGIN LOGGING SETUP'''
 logging_format = "%(asctime)s: %(message)s"
 logging.basicConfig(format=logging_format, level=logging.INFO,
@@ -38,6 +40,7 @@ right_rear_dir_pin = Pin("D5")
 S0 = ADC('A0')
 S1 = ADC('A1')
 S2 = ADC('A2')
+grayscale_adcs = ADCGroup(('A0', 'A1', 'A2'))
 
 Servo_dir_flag = 1
 dir_cal_value = 0
@@ -122,11 +125,7 @@ def set_camera_servo2_angle(value):
     camera_servo_pin2.angle(-1 * (value+cam_cal_value_2))
 
 def get_adc_value():
-    adc_value_list = []
-    adc_value_list.append(S0.read())
-    adc_value_list.append(S1.read())
-    adc_value_list.append(S2.read())
-    return adc_value_list
+    return grayscale_adcs.read_list()
 
 def set_power(speed):
     set_motor_speed(1, speed)
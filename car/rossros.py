@@ -1,7 +1,10 @@
 #! /usr/bin/python3
 import concurrent.futures
+import heapq
+import threading
 import time
 import logging
+import numpy as np
 from readerwriterlock import rwlock
 from logdecorator import log_on_start, log_on_end, log_on_error
 
@@ -11,35 +14,483 @@ logging.basicConfig(format=logging_format, level=logging.INFO,
                     datefmt="%H:%M:%S")
 
 
+class LockStats:
+    """
+    Count of reads and writes on a bus, with the time they spent waiting
+    to acquire its lock
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.reads = 0
+        self.writes = 0
+        self.read_wait = 0.0
+        self.write_wait = 0.0
+        self.read_wait_max = 0.0
+        self.write_wait_max = 0.0
+
+    def record_read(self, wait):
+        self.reads += 1
+        self.read_wait += wait
+        if wait > self.read_wait_max:
+            self.read_wait_max = wait
+
+    def record_write(self, wait):
+        self.writes += 1
+        self.write_wait += wait
+        if wait > self.write_wait_max:
+            self.write_wait_max = wait
+
+    def snapshot(self):
+        """
+        :return: dict of the access counts, and total and maximum lock waits
+            in seconds
+        """
+        return {
+            'reads': self.reads,
+            'writes': self.writes,
+            'read_wait': self.read_wait,
+            'write_wait': self.write_wait,
+            'read_wait_max': self.read_wait_max,
+            'write_wait_max': self.write_wait_max,
+        }
+
+
+# Upper edges of the step latency histogram buckets, in seconds: 1us to ~1s
+# doubling each time, plus a final bucket for anything slower
+LATENCY_BUCKETS = tuple(1e-6 * 2 ** i for i in range(21))
+
+
+class NodeProfile:
+    """
+    Timing of every step of a node: how many there were, a histogram of
+    step latency, how the time was split between the node function and
+    reading and writing busses, and the loop frequency achieved
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.function_time = 0.0
+        self.bus_time = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self._first_start = None
+        self._last_start = None
+
+    def record(self, start, function_time, bus_time):
+        """
+        :param start: float, time.perf_counter() at the start of the step
+        :param function_time: float, seconds spent in the node function
+        :param bus_time: float, seconds spent reading and writing busses
+        """
+        if self._first_start is None:
+            self._first_start = start
+        self._last_start = start
+        self.calls += 1
+        self.function_time += function_time
+        self.bus_time += bus_time
+
+        # Bucket i holds latencies up to 2**i us, so the index is the bit
+        # length of the latency in whole microseconds
+        bucket = min(int((function_time + bus_time) * 1e6).bit_length(), len(LATENCY_BUCKETS))
+        self.histogram[bucket] += 1
+
+    def latency_percentile(self, fraction):
+        """
+        :return: float, upper edge in seconds of the histogram bucket that
+            holds the given fraction of step latencies, or inf if it is the
+            overflow bucket
+        """
+        target = fraction * self.calls
+        total = 0
+        for edge, count in zip(LATENCY_BUCKETS + (float('inf'),), self.histogram):
+            total += count
+            if count and total >= target:
+                return edge
+        return 0.0
+
+    def snapshot(self):
+        """
+        :return: dict of the call count, loop frequency, mean function and
+            bus times, latency percentiles and the raw histogram
+        """
+        calls = self.calls
+        span = (self._last_start - self._first_start) if calls > 1 else 0.0
+        return {
+            'calls': calls,
+            'loop_hz': (calls - 1) / span if span else 0.0,
+            'function_time': self.function_time,
+            'bus_time': self.bus_time,
+            'function_time_mean': self.function_time / calls if calls else 0.0,
+            'bus_time_mean': self.bus_time / calls if calls else 0.0,
+            'latency_p50': self.latency_percentile(0.5),
+            'latency_p99': self.latency_percentile(0.99),
+            'histogram': dict(zip(LATENCY_BUCKETS + (float('inf'),), self.histogram)),
+        }
+
+
+class _TimedLock:
+    """
+    Context manager that times how long acquiring the wrapped lock took
+    """
+
+    def __init__(self, lock, record):
+        self._lock = lock
+        self._record = record
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self._lock.acquire()
+        self._record(time.perf_counter() - start)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
+
+class ProfiledRWLock:
+    """
+    Stands in for a readerwriterlock lock, recording the time every read
+    and write lock acquisition waited in a LockStats
+    """
+
+    def __init__(self, lock, lock_stats):
+        self.lock = lock
+        self.lock_stats = lock_stats
+
+    def gen_rlock(self):
+        return _TimedLock(self.lock.gen_rlock(), self.lock_stats.record_read)
+
+    def gen_wlock(self):
+        return _TimedLock(self.lock.gen_wlock(), self.lock_stats.record_write)
+
+
+BUS_MODES = ('rwlock', 'swap')
+
+
 class Bus:
     """
     Class to allow a single element data bus.
+
+    Every message is stored together with a version number that counts the
+    writes to the bus, and the pair can be read back with get_snapshot.
+    Threads that want to be woken when the bus changes can register a
+    threading.Event with add_listener; it is set after every write.
+
+    Two locking modes are available:
+      'rwlock' (default) guards reads and writes with a reader-writer lock,
+        and is safe for any number of writers
+      'swap' skips the lock and relies on the (version, message) pair being
+        replaced in a single attribute store, which the GIL makes atomic.
+        Only use it when the bus has a single writer
+
+    Whether reads and writes go through the logging decorators is decided
+    once, when the bus is created. Unless told otherwise, a bus is only
+    instrumented if DEBUG messages from this module would be emitted at that
+    point, so that busses created with logging off only pay for the lock.
     """
 
-    def __init__(self, initial_message=0, name="Unnamed Bus"):
-        self.message = initial_message
+    def __init__(self, initial_message=0, name="Unnamed Bus", instrument=None,
+                 mode='rwlock'):
+        if mode not in BUS_MODES:
+            raise ValueError("Bus mode should be one of {0}, not {1}".format(BUS_MODES, mode))
+
+        self._snapshot = (0, initial_message)
         self.name = name
+        self.mode = mode
+        self._listeners = ()
+        self._listeners_lock = threading.Lock()
+        self.lock_stats = None
 
         # Set up the class so that functions can get a lock while working
         self.lock = rwlock.RWLockWriteD()
 
-    @log_on_start(DEBUG, "{self.name:s}: Initiating read by {_name:s}")
-    @log_on_error(DEBUG, "{self.name:s}: Error on read by {_name:s}")
-    @log_on_end(DEBUG, "{self.name:s}: Finished read by {_name:s}")
+        # Single-writer busses swap the snapshot without taking the lock
+        if self.mode == 'swap':
+            self.get_message = self._swap_get_message
+            self.set_message = self._swap_set_message
+            self.get_snapshot = self._swap_get_snapshot
+
+        # Bind the logged accessors over the plain ones if instrumentation is
+        # requested, or if it is left unspecified and DEBUG logging is active
+        if instrument is None:
+            instrument = logging.getLogger(__name__).isEnabledFor(DEBUG)
+        self.instrumented = instrument
+        if self.instrumented:
+            self._read = self.get_message
+            self._write = self.set_message
+            self.get_message = self._logged_get_message
+            self.set_message = self._logged_set_message
+
+    @property
+    def message(self):
+        return self._snapshot[1]
+
+    @property
+    def version(self):
+        return self._snapshot[0]
+
     def get_message(self, _name):
 
         with self.lock.gen_rlock():
-            message = self.message
+            message = self._snapshot[1]
 
         return message
 
+    def set_message(self, message, _name):
+
+        with self.lock.gen_wlock():
+            self._snapshot = (self._snapshot[0] + 1, message)
+
+        for event in self._listeners:
+            event.set()
+
+    def get_snapshot(self, _name):
+        """
+        Returns the current message together with its version number
+        :return: tuple, (version, message)
+        """
+        with self.lock.gen_rlock():
+            snapshot = self._snapshot
+
+        return snapshot
+
+    def _swap_get_message(self, _name):
+
+        return self._snapshot[1]
+
+    def enable_profiling(self):
+        """
+        Starts recording reads and writes, and how long they wait for the
+        lock, in self.lock_stats. 'rwlock' busses get a timing wrapper around
+        their lock; 'swap' busses have no lock, so their accessors are
+        wrapped to count accesses only. Busses that are not profiled pay
+        nothing for it
+        """
+        if self.lock_stats is not None:
+            return
+        self.lock_stats = LockStats(self.name)
+        if self.mode == 'rwlock':
+            self.lock = ProfiledRWLock(self.lock, self.lock_stats)
+            return
+
+        read, write = self._counted_get_message, self._counted_set_message
+        if self.instrumented:
+            self._read, self._write = read, write
+        else:
+            self.get_message, self.set_message = read, write
+        self.get_snapshot = self._counted_get_snapshot
+
+    # Swap-mode busses have no lock to wait for, so only count the accesses
+    def _counted_get_message(self, _name):
+
+        self.lock_stats.record_read(0.0)
+        return self._swap_get_message(_name)
+
+    def _counted_get_snapshot(self, _name):
+
+        self.lock_stats.record_read(0.0)
+        return self._swap_get_snapshot(_name)
+
+    def _counted_set_message(self, message, _name):
+
+        self.lock_stats.record_write(0.0)
+        self._swap_set_message(message, _name)
+
+    def add_listener(self, event):
+        """
+        Registers an event to be set whenever a message is written to the bus
+        :param event: threading.Event
+        :return: None
+        """
+        # Replace rather than mutate the tuple, so writers can iterate over it
+        # without taking a lock. Nodes register from their own threads, so
+        # the replacement itself is locked
+        with self._listeners_lock:
+            self._listeners = self._listeners + (event,)
+
+    def remove_listener(self, event):
+        """
+        Unregisters an event previously passed to add_listener
+        :param event: threading.Event
+        :return: None
+        """
+        with self._listeners_lock:
+            self._listeners = tuple(e for e in self._listeners if e is not event)
+
+    def _swap_set_message(self, message, _name):
+
+        self._snapshot = (self._snapshot[0] + 1, message)
+
+        for event in self._listeners:
+            event.set()
+
+    def _swap_get_snapshot(self, _name):
+
+        return self._snapshot
+
+    @log_on_start(DEBUG, "{self.name:s}: Initiating read by {_name:s}")
+    @log_on_error(DEBUG, "{self.name:s}: Error on read by {_name:s}")
+    @log_on_end(DEBUG, "{self.name:s}: Finished read by {_name:s}")
+    def _logged_get_message(self, _name):
+
+        return self._read(_name)
+
     @log_on_start(DEBUG, "{self.name:s}: Initiating write by {_name:s}")
     @log_on_error(DEBUG, "{self.name:s}: Error on write by {_name:s}")
     @log_on_end(DEBUG, "{self.name:s}: Finished write by {_name:s}")
+    def _logged_set_message(self, message, _name):
+
+        self._write(message, _name)
+
+
+HISTORY_FILTERS = (None, 'mean', 'median', 'ema')
+
+
+class HistoryBus(Bus):
+    """
+    Bus that also keeps the last `capacity` messages, with the time each was
+    written, in a fixed-size numpy ring buffer. Writing is O(1) and memory
+    use does not grow, however far behind the readers are.
+
+    get_message and get_snapshot return the latest message, as for Bus,
+    unless read_filter is 'mean' or 'median', in which case they return that
+    statistic over the last read_window messages, or 'ema', in which case
+    they return an exponential moving average with weight ema_alpha on each
+    new message (updated as messages are written, so reading it is O(1)).
+    This lets a consumer receive smoothed sensor values without any change
+    to its function, whatever schedule or executor runs it.
+
+    Messages must fit the given shape and dtype (e.g. shape=(3,) for ADC
+    triples). None is stored as NaN, so needs a float dtype. The initial
+    message is only a placeholder and is not stored, so it does not drag
+    the filters towards it: until the first write, reads return it as it
+    is, and the history is empty.
+    """
+
+    def __init__(self, initial_message=0, name="Unnamed Bus", capacity=64, shape=(),
+                 dtype='float64', read_filter=None, read_window=None, ema_alpha=0.2,
+                 instrument=None):
+        if read_filter not in HISTORY_FILTERS:
+            raise ValueError("read_filter should be one of {0}, not {1}".format(HISTORY_FILTERS,
+                                                                              read_filter))
+
+        self.capacity = capacity
+        self.read_filter = read_filter
+        self.read_window = read_window
+        self.ema_alpha = ema_alpha
+        self._ema = None
+        self._values = np.zeros((capacity,) + tuple(shape), dtype=dtype)
+        self._times = np.zeros(capacity)
+        self._count = 0
+
+        # The ring buffer can't be updated in a single store, so always lock
+        super().__init__(initial_message, name, instrument, mode='rwlock')
+
+    def _append(self, message):
+        idx = self._count % self.capacity
+        self._values[idx] = np.nan if message is None else message
+        self._times[idx] = time.monotonic()
+        self._count += 1
+
+        # None leaves the average where it was
+        if message is not None:
+            if self._ema is None:
+                self._ema = np.array(self._values[idx])
+            else:
+                self._ema += self.ema_alpha * (self._values[idx] - self._ema)
+
+    def get_message(self, _name):
+
+        if self.read_filter is None:
+            return super().get_message(_name)
+        with self.lock.gen_rlock():
+            return self._filtered_message()
+
+    def get_snapshot(self, _name):
+        """
+        Returns the current message, with read_filter applied as for
+        get_message, together with its version number, so that nodes on the
+        'input' schedule and the cooperative and async executors read the
+        same filtered value
+        :return: tuple, (version, message)
+        """
+        with self.lock.gen_rlock():
+            return self._snapshot[0], self._filtered_message()
+
+    def _filtered_message(self):
+        # The caller holds the read lock, which is not reentrant
+        if self._count == 0:
+            return self._snapshot[1]
+        if self.read_filter == 'mean':
+            return np.mean(self._values[self._window_indices(self.read_window)], axis=0)
+        if self.read_filter == 'median':
+            return np.median(self._values[self._window_indices(self.read_window)], axis=0)
+        if self.read_filter == 'ema':
+            return None if self._ema is None else self._ema.copy()[()]
+        return self._snapshot[1]
+
     def set_message(self, message, _name):
 
         with self.lock.gen_wlock():
-            self.message = message
+            self._append(message)
+            self._snapshot = (self._snapshot[0] + 1, message)
+
+        for event in self._listeners:
+            event.set()
+
+    def _window_indices(self, n):
+        # Ring positions of the last n messages, oldest first
+        n = min(self._count, self.capacity) if n is None else min(n, self._count, self.capacity)
+        return np.arange(self._count - n, self._count) % self.capacity
+
+    def last(self, n=None):
+        """
+        :param n: int, number of messages, or None for all that are stored
+        :return: numpy array of the last n messages, oldest first
+        """
+        with self.lock.gen_rlock():
+            return self._values[self._window_indices(n)]
+
+    def last_with_times(self, n=None):
+        """
+        :return: tuple of numpy arrays, (write times, messages) of the last
+            n messages, oldest first. Times are from time.monotonic()
+        """
+        with self.lock.gen_rlock():
+            idx = self._window_indices(n)
+            return self._times[idx], self._values[idx]
+
+    def since(self, t):
+        """
+        :param t: float, time.monotonic() value
+        :return: numpy array of the stored messages written at or after t,
+            oldest first
+        """
+        with self.lock.gen_rlock():
+            idx = self._window_indices(None)
+            start = np.searchsorted(self._times[idx], t)
+            return self._values[idx[start:]]
+
+    def mean(self, n=None):
+        """
+        :return: mean of the last n messages, per element for array messages
+        """
+        return np.mean(self.last(n), axis=0)
+
+    def median(self, n=None):
+        """
+        :return: median of the last n messages, per element for array messages
+        """
+        return np.median(self.last(n), axis=0)
+
+    def ema(self):
+        """
+        :return: exponential moving average of the messages, or None if
+            none have been written or every message so far has been None
+        """
+        with self.lock.gen_rlock():
+            return None if self._ema is None else self._ema.copy()[()]
 
 
 # Create a set of default input and output busses
@@ -52,18 +503,84 @@ def ensureTuple(value):
     """ Function that wraps an input value in a tuple if it is not already a tuple"""
     if isinstance(value, tuple):
         value_tuple = value
+    elif isinstance(value, list):
+        value_tuple = tuple(value)
     else:
         value_tuple = (value,)  # comma creates the tuple
 
     return value_tuple
 
 
+SCHEDULES = ('delay', 'input', 'rate')
+OVERRUN_POLICIES = ('skip', 'catch_up')
+
+
+class PeriodStats:
+    """
+    Running record of how closely a fixed-rate node keeps to its period.
+    Jitter is the difference between the measured time from one iteration
+    start to the next and the nominal period.
+    """
+
+    def __init__(self, period):
+        self.period = period
+        self.iterations = 0
+        self.overruns = 0  # iterations that finished after the next deadline
+        self.skipped = 0  # deadlines dropped under the 'skip' policy
+        self._last_start = None
+        self._intervals = 0
+        self._jitter_sum = 0.0
+        self._jitter_sq_sum = 0.0
+        self._jitter_max = 0.0
+
+    def record_start(self, now):
+        """Records the start time of an iteration"""
+        if self._last_start is not None:
+            jitter = (now - self._last_start) - self.period
+            self._intervals += 1
+            self._jitter_sum += jitter
+            self._jitter_sq_sum += jitter * jitter
+            self._jitter_max = max(self._jitter_max, abs(jitter))
+        self._last_start = now
+        self.iterations += 1
+
+    def snapshot(self):
+        """
+        :return: dict with the iteration, overrun and skip counts, and the
+            mean, RMS and maximum absolute period jitter in seconds
+        """
+        n = self._intervals
+        return {
+            'period': self.period,
+            'iterations': self.iterations,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'jitter_mean': self._jitter_sum / n if n else 0.0,
+            'jitter_rms': (self._jitter_sq_sum / n) ** 0.5 if n else 0.0,
+            'jitter_max': self._jitter_max,
+        }
+
+
 class ConsumerProducer:
     """
     Class that turns a provided function into a service that reads from
     the input busses, stores the resulting data into the output busses,
     and watches a set of termination busses for a "True" signal, at which
     point the service shuts down
+
+    The schedule argument selects when the function is called:
+      'delay' (default) calls it in a loop, sleeping for delay seconds
+        after each call
+      'input' blocks until at least one input bus has been written since
+        the last call (or a termination bus is written), then calls it and
+        sleeps for delay seconds. Nodes that only produce should not use it,
+        since their input bus never changes
+      'rate' starts an iteration every delay seconds, measured against
+        absolute deadlines on the monotonic clock, so the time spent in the
+        function does not stretch the period. When an iteration runs past
+        the next deadline, overrun_policy picks between dropping the missed
+        deadlines ('skip') or running back-to-back until the schedule has
+        caught up ('catch_up'). Timing is recorded in period_stats
     """
 
     @log_on_start(DEBUG, "{name:s}: Starting to create consumer-producer")
@@ -75,7 +592,17 @@ class ConsumerProducer:
                  output_busses=default_output_bus,
                  delay=0,
                  termination_busses=default_termination_bus,
-                 name="Unnamed consumer_producer"):
+                 name="Unnamed consumer_producer",
+                 schedule='delay',
+                 overrun_policy='skip'):
+
+        if schedule not in SCHEDULES:
+            raise ValueError("schedule should be one of {0}, not {1}".format(SCHEDULES, schedule))
+        if overrun_policy not in OVERRUN_POLICIES:
+            raise ValueError("overrun_policy should be one of {0}, not {1}".format(OVERRUN_POLICIES,
+                                                                                 overrun_policy))
+        if schedule == 'rate' and delay <= 0:
+            raise ValueError("the 'rate' schedule needs a positive delay, not {0}".format(delay))
 
         self.consumer_producer_function = consumer_producer_function
         self.input_busses = ensureTuple(input_busses)
@@ -83,12 +610,23 @@ class ConsumerProducer:
         self.delay = delay
         self.termination_busses = ensureTuple(termination_busses)
         self.name = name
+        self.schedule = schedule
+        self.overrun_policy = overrun_policy
+        self.period_stats = PeriodStats(delay)
+        self.profile = None
 
     @log_on_start(DEBUG, "{self.name:s}: Starting consumer-producer service")
     @log_on_error(DEBUG, "{self.name:s}: Encountered an error while closing down consumer-producer")
     @log_on_end(DEBUG, "{self.name:s}: Closing down consumer-producer service")
     def __call__(self):
 
+        if self.schedule == 'input':
+            self.runOnInput()
+            return
+        if self.schedule == 'rate':
+            self.runAtRate()
+            return
+
         while True:
 
             # Check if the loop should terminate
@@ -96,17 +634,130 @@ class ConsumerProducer:
             if self.checkTerminationBusses():
                 break
 
-            # Collect all of the values from the input busses into a list
+            # Read the inputs, call the function and write its outputs
+            self.runStep()
+
+            # Pause for set amount of time
+            time.sleep(self.delay)
+
+    # Variant of the main loop that only calls the function once the input
+    # busses have changed
+    def runOnInput(self):
+
+        # Get woken up by any write to an input or termination bus
+        wakeup = threading.Event()
+        watched_busses = self.input_busses + self.termination_busses
+        for bus in watched_busses:
+            bus.add_listener(wakeup)
+
+        last_versions = None
+        try:
+            while True:
+
+                # Clear the wakeup before looking at the busses, so that a write
+                # landing after this point is not missed
+                wakeup.clear()
+
+                if self.checkTerminationBusses():
+                    break
+
+                # Nothing new on the inputs, so sleep until a bus is written
+                versions, input_values = self.collectNewInputs(last_versions)
+                if input_values is None:
+                    wakeup.wait()
+                    continue
+                last_versions = versions
+
+                self.runStep(input_values)
+
+                if self.delay:
+                    time.sleep(self.delay)
+
+        finally:
+            for bus in watched_busses:
+                bus.remove_listener(wakeup)
+
+    # Variant of the main loop that starts iterations against fixed deadlines
+    def runAtRate(self):
+
+        deadline = time.monotonic()
+
+        while True:
+
+            if self.checkTerminationBusses():
+                break
+
+            self.period_stats.record_start(time.monotonic())
+            self.runStep()
+
+            deadline = self.advanceDeadline(deadline + self.delay, time.monotonic())
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+
+    # Run the function once, reading the input busses unless the values
+    # are provided, and deal its output into the output busses
+    def runStep(self, input_values=None):
+
+        # Collect all of the values from the input busses into a list
+        if input_values is None:
             input_values = self.collectBussesToValues(self.input_busses)
 
-            # Get the output value or tuple of values corresponding to the inputs
-            output_values = self.consumer_producer_function(*input_values)
+        # Get the output value or tuple of values corresponding to the inputs
+        output_values = self.consumer_producer_function(*input_values)
 
-            # Deal the values into the output busses
-            self.dealValuesToBusses(output_values, self.output_busses)
+        # Deal the values into the output busses
+        self.dealValuesToBusses(output_values, self.output_busses)
 
-            # Pause for set amount of time
-            time.sleep(self.delay)
+    # Start timing every step of the node. Like bus instrumentation, this
+    # rebinds runStep, so nodes that are not profiled pay nothing for it
+    def enableProfiling(self):
+
+        if self.profile is None:
+            self.profile = NodeProfile(self.name)
+            self.runStep = self._profiledRunStep
+
+    def _profiledRunStep(self, input_values=None):
+
+        start = time.perf_counter()
+        if input_values is None:
+            input_values = self.collectBussesToValues(self.input_busses)
+        called = time.perf_counter()
+        output_values = self.consumer_producer_function(*input_values)
+        returned = time.perf_counter()
+        self.dealValuesToBusses(output_values, self.output_busses)
+        end = time.perf_counter()
+
+        self.profile.record(start, returned - called, (called - start) + (end - returned))
+
+    # Read the input busses, returning their versions and their messages,
+    # or None in place of the messages if no version differs from last_versions
+    def collectNewInputs(self, last_versions):
+
+        # Read versions and messages together, so the versions recorded
+        # match the values handed to the function
+        snapshots = [bus.get_snapshot(self.name) for bus in self.input_busses]
+        versions = [version for version, _ in snapshots]
+        if versions == last_versions:
+            return versions, None
+
+        return versions, [message for _, message in snapshots]
+
+    # Apply the overrun policy to the next deadline of a 'rate' node, given
+    # the time at which its last iteration finished
+    def advanceDeadline(self, deadline, now):
+
+        if now > deadline:
+            self.period_stats.overruns += 1
+            if self.overrun_policy == 'skip':
+                # Move the deadline to the first one still in the future
+                missed = int((now - deadline) // self.delay) + 1
+                self.period_stats.skipped += missed
+                deadline += missed * self.delay
+            # Under 'catch_up' the deadline stays in the past, so the next
+            # iterations run without sleeping until the schedule catches up
+
+        return deadline
 
     # Take in a bus or a tuple of busses, and store their
     # messages into a list
@@ -183,7 +834,9 @@ class Producer(ConsumerProducer):
                  output_busses,
                  delay=0,
                  termination_busses=default_termination_bus,
-                 name="Unnamed producer"):
+                 name="Unnamed producer",
+                 schedule='delay',
+                 overrun_policy='skip'):
 
         # Producers don't use an input bus
         input_busses = default_input_bus
@@ -200,7 +853,9 @@ class Producer(ConsumerProducer):
             output_busses,
             delay,
             termination_busses,
-            name)
+            name,
+            schedule,
+            overrun_policy)
 
 
 class Consumer(ConsumerProducer):
@@ -217,7 +872,9 @@ class Consumer(ConsumerProducer):
                  input_busses,
                  delay=0,
                  termination_busses=default_termination_bus,
-                 name="Unnamed consumer"):
+                 name="Unnamed consumer",
+                 schedule='delay',
+                 overrun_policy='skip'):
 
         # Match naming convention for this class with its parent class
         consumer_producer_function = consumer_function
@@ -232,7 +889,9 @@ class Consumer(ConsumerProducer):
             output_busses,
             delay,
             termination_busses,
-            name)
+            name,
+            schedule,
+            overrun_policy)
 
 
 class Timer(Producer):
@@ -289,14 +948,16 @@ class Printer(Consumer):
                  delay=0,  # how many seconds to sleep for between printing data
                  termination_busses=default_termination_bus,  # busses to check for termination
                  name="Unnamed termination timer",  # name of this printer
-                 print_prefix="Unspecified prefix: "):  # prefix for output
+                 print_prefix="Unspecified prefix: ",  # prefix for output
+                 schedule='delay'):  # 'input' to only print when the bus changes
 
         super().__init__(
             self.print_bus,  # Printer class defines its own printing function
             printer_bus,
             delay,
             termination_busses,
-            name)
+            name,
+            schedule)
 
         self.print_prefix = print_prefix
 
@@ -304,6 +965,102 @@ class Printer(Consumer):
         print(self.print_prefix + str(message))
 
 
+def graphBusses(producer_consumer_list):
+    """ Function that lists the busses used by a set of ConsumerProducers, each once"""
+    busses = []
+    for cp in producer_consumer_list:
+        for bus in cp.input_busses + cp.output_busses + cp.termination_busses:
+            if bus not in busses:
+                busses.append(bus)
+    return busses
+
+
+def profiledBusses(producer_consumer_list):
+    """
+    Function that lists the busses of a set of ConsumerProducers that can be
+    profiled: rossros Busses, other than the module's default busses, which
+    every graph in the process shares
+    """
+    default_busses = (default_input_bus, default_output_bus, default_termination_bus)
+    return [bus for bus in graphBusses(producer_consumer_list)
+            if isinstance(bus, Bus) and not any(bus is default for default in default_busses)]
+
+
+def enableGraphProfiling(producer_consumer_list):
+    """ Function that turns on profiling for a set of ConsumerProducers and their busses"""
+    for cp in producer_consumer_list:
+        cp.enableProfiling()
+    for bus in profiledBusses(producer_consumer_list):
+        bus.enable_profiling()
+
+
+def profileSnapshot(producer_consumer_list):
+    """
+    Function that collects the profiles of a set of ConsumerProducers and
+    the lock statistics of their busses, for the ones that are profiled.
+    Busses that share a name are told apart by a number after it
+    :return: dict, {'nodes': {node name: NodeProfile.snapshot()},
+                    'busses': {bus name: LockStats.snapshot()}}
+    """
+    busses = {}
+    for bus in profiledBusses(producer_consumer_list):
+        if bus.lock_stats is None:
+            continue
+        name = bus.name
+        copies = 1
+        while name in busses:
+            copies += 1
+            name = "{0} ({1})".format(bus.name, copies)
+        busses[name] = bus.lock_stats.snapshot()
+
+    return {
+        'nodes': {cp.name: cp.profile.snapshot()
+                  for cp in producer_consumer_list if cp.profile is not None},
+        'busses': busses,
+    }
+
+
+class ProfilePrinter(Producer):
+    """
+    ProfilePrinter is a producer that prints a summary of the profiles of a
+    set of ConsumerProducers and their busses at specified intervals.
+    Profiling has to be turned on separately, e.g. with enableGraphProfiling
+    """
+
+    @log_on_start(DEBUG, "{name:s}: Starting to create profile printer")
+    @log_on_error(DEBUG, "{name:s}: Encountered an error while creating profile printer")
+    @log_on_end(DEBUG, "{name:s}: Finished creating profile printer")
+    def __init__(self,
+                 producer_consumer_list,  # nodes whose profiles should be printed
+                 delay=1,  # how many seconds to sleep for between summaries
+                 termination_busses=default_termination_bus,
+                 name="Unnamed profile printer"):
+
+        super().__init__(
+            self.print_profiles,  # ProfilePrinter class defines its own printing function
+            default_output_bus,
+            delay,
+            termination_busses,
+            name)
+
+        self.producer_consumer_list = producer_consumer_list
+
+    def print_profiles(self):
+        snapshot = profileSnapshot(self.producer_consumer_list)
+        lines = ["{:<40s} {:>8s} {:>8s} {:>10s} {:>10s} {:>10s}".format(
+            'node', 'calls', 'Hz', 'fn ms', 'bus ms', 'p99 ms')]
+        for name, p in snapshot['nodes'].items():
+            lines.append("{:<40s} {:>8d} {:>8.1f} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+                name, p['calls'], p['loop_hz'], p['function_time_mean'] * 1000,
+                p['bus_time_mean'] * 1000, p['latency_p99'] * 1000))
+        lines.append("{:<40s} {:>8s} {:>8s} {:>10s} {:>10s}".format(
+            'bus', 'reads', 'writes', 'rd wait ms', 'wr wait ms'))
+        for name, b in snapshot['busses'].items():
+            lines.append("{:<40s} {:>8d} {:>8d} {:>10.3f} {:>10.3f}".format(
+                name, b['reads'], b['writes'], b['read_wait'] * 1000, b['write_wait'] * 1000))
+        print(self.name + ":\n" + "\n".join(lines))
+
+
 @log_on_start(DEBUG, "runConcurrently: Starting concurrent execution")
 @log_on_error(DEBUG, "runConcurrently: Encountered an error during concurrent execution")
 @log_on_end(DEBUG, "runConcurrently: Finished concurrent execution")
@@ -325,3 +1082,133 @@ def runConcurrently(producer_consumer_list):
     # Loop over the executors that were created above, running their result methods
     for e in executor_list:
         e.result()
+
+
+class CooperativeScheduler:
+    """
+    Runs a set of ConsumerProducers in a single thread, calling each node's
+    function when it is due according to its schedule, instead of giving
+    every node its own looping thread:
+      'delay' nodes are due delay seconds after their last call finished
+      'rate' nodes are due at their next deadline (with the same overrun
+        handling and period_stats as when they run in their own thread)
+      'input' nodes are due whenever one of their input busses has a newer
+        version than the last one they processed
+    Timed nodes wait in a run-queue ordered by due time, with ties going to
+    the node listed first. Between passes the thread sleeps until the next
+    timed node is due or a bus watched by an 'input' node is written.
+
+    Node functions must not block, since they share the thread with every
+    other node; blocking nodes should be left to runConcurrently.
+    """
+
+    def __init__(self, producer_consumer_list):
+        self.producer_consumer_list = list(producer_consumer_list)
+
+    def run(self):
+
+        # Timed nodes go in a heap of (due time, list position, node)
+        now = time.monotonic()
+        run_queue = []
+        input_nodes = []
+        for order, cp in enumerate(self.producer_consumer_list):
+            if cp.schedule == 'input':
+                input_nodes.append(cp)
+            else:
+                heapq.heappush(run_queue, (now, order, cp))
+
+        # Get woken up by writes that can make an input node due, or stop it.
+        # Each input node also gets its own event, so that a pass only looks
+        # at the nodes whose busses were actually written
+        wakeup = threading.Event()
+        node_events = {cp: threading.Event() for cp in input_nodes}
+        listeners = []
+        for cp in input_nodes:
+            for bus in cp.input_busses + cp.termination_busses:
+                listeners.append((bus, wakeup))
+                listeners.append((bus, node_events[cp]))
+        for bus, event in listeners:
+            bus.add_listener(event)
+
+        # Every input node runs on the first pass
+        for event in node_events.values():
+            event.set()
+
+        last_versions = {}
+        try:
+            while input_nodes or run_queue:
+
+                # Clear the wakeups before looking at the busses, so that a write
+                # landing after this point is not missed
+                wakeup.clear()
+
+                for cp in list(input_nodes):
+                    if not node_events[cp].is_set():
+                        continue
+                    node_events[cp].clear()
+                    if cp.checkTerminationBusses():
+                        input_nodes.remove(cp)
+                        continue
+                    versions, input_values = cp.collectNewInputs(last_versions.get(cp))
+                    if input_values is not None:
+                        last_versions[cp] = versions
+                        cp.runStep(input_values)
+
+                # Pull out everything due now before running any of it, so that
+                # nodes with no delay cannot keep the rest of the pass waiting
+                now = time.monotonic()
+                ready = []
+                while run_queue and run_queue[0][0] <= now:
+                    ready.append(heapq.heappop(run_queue))
+
+                for due, order, cp in ready:
+                    if cp.checkTerminationBusses():
+                        continue
+                    if cp.schedule == 'rate':
+                        cp.period_stats.record_start(time.monotonic())
+                        cp.runStep()
+                        due = cp.advanceDeadline(due + cp.delay, time.monotonic())
+                    else:
+                        cp.runStep()
+                        due = time.monotonic() + cp.delay
+                    heapq.heappush(run_queue, (due, order, cp))
+
+                # Sleep until the next timed node is due, or a watched bus changes
+                if run_queue:
+                    timeout = run_queue[0][0] - time.monotonic()
+                    if timeout > 0:
+                        wakeup.wait(timeout)
+                elif input_nodes:
+                    wakeup.wait()
+
+        finally:
+            for bus, event in listeners:
+                bus.remove_listener(event)
+
+
+@log_on_start(DEBUG, "runCooperatively: Starting cooperative execution")
+@log_on_error(DEBUG, "runCooperatively: Encountered an error during cooperative execution")
+@log_on_end(DEBUG, "runCooperatively: Finished cooperative execution")
+def runCooperatively(producer_consumer_list, threaded_list=()):
+    """
+    runCooperatively is a function that runs a set of ConsumerProducer functions
+    together in the calling thread using a CooperativeScheduler. Any of them
+    that also appear in threaded_list (for example, nodes that block on
+    hardware) are instead given their own thread, as in runConcurrently
+    """
+
+    threaded_list = list(threaded_list)
+    cooperative_list = [cp for cp in producer_consumer_list if cp not in threaded_list]
+
+    if not threaded_list:
+        CooperativeScheduler(cooperative_list).run()
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(threaded_list)) as executor:
+
+        # Start the blocking nodes in their own threads, then run the rest here
+        executor_list = [executor.submit(cp) for cp in threaded_list]
+        CooperativeScheduler(cooperative_list).run()
+
+    for e in executor_list:
+        e.result()
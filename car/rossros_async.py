@@ -0,0 +1,328 @@
+#! /usr/bin/python3
+"""
+rossros_async.py
+
+asyncio versions of the rossros consumer-producers, so that a graph can run
+on the same event loop as other asyncio code (such as the websocket server
+in the web control example) instead of in its own threads.
+
+Node functions can be coroutine functions, which are awaited on the loop,
+or plain functions. Plain functions are treated as blocking (e.g. hardware
+reads) and run in a bounded thread pool so they do not stall the loop,
+unless the node is made with blocking=False: fast functions such as the
+interpreters are then called directly on the loop, saving a thread hop per
+message.
+
+    async def main():
+        await asyncio.gather(run_graph(nodes), websocket_server())
+"""
+
+import asyncio
+import concurrent.futures
+import inspect
+import threading
+import time
+from logdecorator import log_on_start, log_on_end, log_on_error
+from logdecorator.asyncio import async_log_on_start, async_log_on_end, async_log_on_error
+
+from rossros import DEBUG, Bus, ConsumerProducer, default_input_bus, \
+    default_output_bus, default_termination_bus
+
+DEFAULT_BLOCKING_WORKERS = 4
+
+
+class LoopEvent(asyncio.Event):
+    """
+    asyncio.Event that can also be set from other threads, so that it can be
+    registered as a listener on busses written by threaded nodes.
+    Must be created while the event loop is running.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._event_loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+
+    def set(self):
+        if threading.get_ident() == self._loop_thread:
+            super().set()
+        else:
+            self._event_loop.call_soon_threadsafe(super().set)
+
+
+class AsyncBus(Bus):
+    """
+    Bus for graphs that run on an event loop. Coroutines on one loop never
+    write concurrently, so the bus uses the lock-free 'swap' mode, and it
+    can be awaited until a new message arrives.
+    """
+
+    def __init__(self, initial_message=0, name="Unnamed Bus", instrument=None):
+        super().__init__(initial_message, name, instrument, mode='swap')
+
+    async def wait_for_change(self, last_version, _name):
+        """
+        Waits until the bus version differs from last_version
+        :return: tuple, (version, message)
+        """
+        if self.version == last_version:
+            event = LoopEvent()
+            self.add_listener(event)
+            try:
+                while self.version == last_version:
+                    event.clear()
+                    await event.wait()
+            finally:
+                self.remove_listener(event)
+
+        return self.get_snapshot(_name)
+
+
+class AsyncConsumerProducer(ConsumerProducer):
+    """
+    Coroutine version of ConsumerProducer, with the same arguments and
+    schedules. Awaiting the object runs the node until a termination bus
+    is set. Plain (non-coroutine) functions are run in executor, or the
+    loop's default executor if it is None, unless blocking is False, in
+    which case they are called on the loop.
+    """
+
+    @log_on_start(DEBUG, "{name:s}: Starting to create async consumer-producer")
+    @log_on_error(DEBUG, "{name:s}: Encountered an error while creating async consumer-producer")
+    @log_on_end(DEBUG, "{name:s}: Finished creating async consumer-producer")
+    def __init__(self,
+                 consumer_producer_function,
+                 input_busses=default_input_bus,
+                 output_busses=default_output_bus,
+                 delay=0,
+                 termination_busses=default_termination_bus,
+                 name="Unnamed consumer_producer",
+                 schedule='delay',
+                 overrun_policy='skip',
+                 executor=None,
+                 blocking=True):
+
+        super().__init__(
+            consumer_producer_function,
+            input_busses,
+            output_busses,
+            delay,
+            termination_busses,
+            name,
+            schedule,
+            overrun_policy)
+
+        self.executor = executor
+        self.is_coroutine = inspect.iscoroutinefunction(consumer_producer_function)
+        self.blocking = blocking
+
+    @async_log_on_start(DEBUG, "{self.name:s}: Starting async consumer-producer service")
+    @async_log_on_error(DEBUG, "{self.name:s}: Encountered an error while closing down async consumer-producer")
+    @async_log_on_end(DEBUG, "{self.name:s}: Closing down async consumer-producer service")
+    async def __call__(self):
+
+        if self.schedule == 'input':
+            await self.runOnInput()
+            return
+        if self.schedule == 'rate':
+            await self.runAtRate()
+            return
+
+        while True:
+
+            if self.checkTerminationBusses():
+                break
+
+            await self.runStep()
+
+            # Always yield to the loop, even with no delay
+            await asyncio.sleep(self.delay)
+
+    async def runOnInput(self):
+
+        # Get woken up by any write to an input or termination bus
+        wakeup = LoopEvent()
+        watched_busses = self.input_busses + self.termination_busses
+        for bus in watched_busses:
+            bus.add_listener(wakeup)
+
+        last_versions = None
+        try:
+            while True:
+
+                wakeup.clear()
+
+                if self.checkTerminationBusses():
+                    break
+
+                versions, input_values = self.collectNewInputs(last_versions)
+                if input_values is None:
+                    await wakeup.wait()
+                    continue
+                last_versions = versions
+
+                await self.runStep(input_values)
+
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+
+        finally:
+            for bus in watched_busses:
+                bus.remove_listener(wakeup)
+
+    async def runAtRate(self):
+
+        deadline = time.monotonic()
+
+        while True:
+
+            if self.checkTerminationBusses():
+                break
+
+            self.period_stats.record_start(time.monotonic())
+            await self.runStep()
+
+            deadline = self.advanceDeadline(deadline + self.delay, time.monotonic())
+            await asyncio.sleep(max(0, deadline - time.monotonic()))
+
+    async def runStep(self, input_values=None):
+
+        if input_values is None:
+            input_values = self.collectBussesToValues(self.input_busses)
+
+        output_values = await self.callFunction(input_values)
+
+        self.dealValuesToBusses(output_values, self.output_busses)
+
+    async def callFunction(self, input_values):
+        """
+        Calls the node's function with input_values, in the way it needs
+        :return: the function's output values
+        """
+        if self.is_coroutine:
+            return await self.consumer_producer_function(*input_values)
+        if not self.blocking:
+            return self.consumer_producer_function(*input_values)
+
+        # Blocking functions run off the loop, in the bounded executor
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.consumer_producer_function, *input_values)
+
+    async def _profiledRunStep(self, input_values=None):
+
+        start = time.perf_counter()
+        if input_values is None:
+            input_values = self.collectBussesToValues(self.input_busses)
+        called = time.perf_counter()
+
+        # For blocking functions this includes the wait for an executor thread
+        output_values = await self.callFunction(input_values)
+
+        returned = time.perf_counter()
+        self.dealValuesToBusses(output_values, self.output_busses)
+        end = time.perf_counter()
+
+        self.profile.record(start, returned - called, (called - start) + (end - returned))
+
+
+class AsyncProducer(AsyncConsumerProducer):
+    """
+    Coroutine version of Producer
+    """
+
+    @log_on_start(DEBUG, "{name:s}: Starting to create async producer")
+    @log_on_error(DEBUG, "{name:s}: Encountered an error while creating async producer")
+    @log_on_end(DEBUG, "{name:s}: Finished creating async producer")
+    def __init__(self,
+                 producer_function,
+                 output_busses,
+                 delay=0,
+                 termination_busses=default_termination_bus,
+                 name="Unnamed producer",
+                 schedule='delay',
+                 overrun_policy='skip',
+                 executor=None,
+                 blocking=True):
+
+        # Producers don't use an input bus
+        input_busses = default_input_bus
+
+        # Wrap the producer function so it ignores the input value, keeping
+        # it a coroutine function if it was one
+        if inspect.iscoroutinefunction(producer_function):
+            async def consumer_producer_function(_input_value): return await producer_function()
+        else:
+            def consumer_producer_function(_input_value): return producer_function()
+
+        super().__init__(
+            consumer_producer_function,
+            input_busses,
+            output_busses,
+            delay,
+            termination_busses,
+            name,
+            schedule,
+            overrun_policy,
+            executor,
+            blocking)
+
+
+class AsyncConsumer(AsyncConsumerProducer):
+    """
+    Coroutine version of Consumer
+    """
+
+    @log_on_start(DEBUG, "{name:s}: Starting to create async consumer")
+    @log_on_error(DEBUG, "{name:s}: Encountered an error while creating async consumer")
+    @log_on_end(DEBUG, "{name:s}: Finished creating async consumer")
+    def __init__(self,
+                 consumer_function,
+                 input_busses,
+                 delay=0,
+                 termination_busses=default_termination_bus,
+                 name="Unnamed consumer",
+                 schedule='delay',
+                 overrun_policy='skip',
+                 executor=None,
+                 blocking=True):
+
+        # Consumers don't use an output bus
+        output_busses = default_output_bus
+
+        super().__init__(
+            consumer_function,
+            input_busses,
+            output_busses,
+            delay,
+            termination_busses,
+            name,
+            schedule,
+            overrun_policy,
+            executor,
+            blocking)
+
+
+@async_log_on_start(DEBUG, "run_graph: Starting asynchronous execution")
+@async_log_on_error(DEBUG, "run_graph: Encountered an error during asynchronous execution")
+@async_log_on_end(DEBUG, "run_graph: Finished asynchronous execution")
+async def run_graph(producer_consumer_list, max_blocking_workers=DEFAULT_BLOCKING_WORKERS):
+    """
+    run_graph is a coroutine that runs a set of AsyncConsumerProducers on the
+    current event loop until they have all terminated. Nodes without their
+    own executor share a thread pool of max_blocking_workers threads for
+    their blocking functions
+    """
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_blocking_workers) as executor:
+
+        # Lend the pool only for this run, it is shut down when the run ends
+        borrowers = [cp for cp in producer_consumer_list if cp.executor is None]
+        for cp in borrowers:
+            cp.executor = executor
+
+        try:
+            await asyncio.gather(*(cp() for cp in producer_consumer_list))
+        finally:
+            for cp in borrowers:
+                cp.executor = None
@@ -0,0 +1,223 @@
+"""
+rossros_benchmark.py
+
+Microbenchmarks for the rossros busses. Run directly to print the results:
+
+    python3 rossros_benchmark.py
+"""
+
+import argparse
+import threading
+import time
+
+from rossros import Bus, Consumer, ConsumerProducer, Producer, Timer, \
+    runConcurrently, runCooperatively
+
+
+def time_calls(fn, duration):
+    """
+    Calls fn repeatedly for roughly duration seconds
+    :return: float, calls per second
+    """
+    calls = 0
+    batch = 1000
+    start = time.perf_counter()
+    end = start + duration
+    now = start
+    while now < end:
+        for _ in range(batch):
+            fn()
+        calls += batch
+        now = time.perf_counter()
+    return calls / (now - start)
+
+
+def bench_instrumentation(duration=1.0):
+    """
+    Measures reads/sec and writes/sec on a single bus with the logging
+    decorators bound (instrument=True) and compiled out (instrument=False)
+    :return: dict, {instrumented: (reads_per_sec, writes_per_sec)}
+    """
+    results = {}
+    for instrument in (True, False):
+        bus = Bus(0, name='benchmark bus', instrument=instrument)
+        reads = time_calls(lambda: bus.get_message('benchmark'), duration)
+        writes = time_calls(lambda: bus.set_message(1, 'benchmark'), duration)
+        results[instrument] = (reads, writes)
+    return results
+
+
+def print_instrumentation(duration):
+    results = bench_instrumentation(duration)
+    print('Bus instrumentation')
+    print('{:>14s} {:>14s} {:>14s}'.format('decorators', 'reads/sec', 'writes/sec'))
+    for instrument, (reads, writes) in results.items():
+        print('{:>14s} {:>14,.0f} {:>14,.0f}'.format(
+            'on' if instrument else 'off', reads, writes))
+    speedup = results[False][0] / results[True][0]
+    print('read speedup with decorators off: {:.1f}x'.format(speedup))
+
+
+def bench_contention(mode, n_readers, duration=1.0):
+    """
+    Runs one writer thread and n_readers reader threads against a single
+    uninstrumented bus in the given mode
+    :return: tuple, (total reads_per_sec, writes_per_sec)
+    """
+    bus = Bus(0, name='benchmark bus', instrument=False, mode=mode)
+    stop = threading.Event()
+    counts = [0] * (n_readers + 1)
+
+    def reader(idx):
+        name = 'reader {}'.format(idx)
+        n = 0
+        while not stop.is_set():
+            bus.get_message(name)
+            n += 1
+        counts[idx] = n
+
+    def writer():
+        n = 0
+        while not stop.is_set():
+            n += 1
+            bus.set_message(n, 'writer')
+        counts[n_readers] = n
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(n_readers)]
+    threads.append(threading.Thread(target=writer))
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return sum(counts[:n_readers]) / elapsed, counts[n_readers] / elapsed
+
+
+def print_contention(duration):
+    print('Bus contention (1 writer thread)')
+    print('{:>8s} {:>8s} {:>14s} {:>14s}'.format('mode', 'readers', 'reads/sec', 'writes/sec'))
+    for n_readers in (1, 4, 16):
+        for mode in ('rwlock', 'swap'):
+            reads, writes = bench_contention(mode, n_readers, duration)
+            print('{:>8s} {:>8d} {:>14,.0f} {:>14,.0f}'.format(mode, n_readers, reads, writes))
+
+
+def build_line_following_graph(duration, latencies):
+    """
+    Builds an 11 node graph shaped like concurrent_exec_test.py, with
+    simulated sensors that stamp each reading with the time it was taken.
+    The line controller appends the sensor-to-motor latency of every
+    reading it acts on to latencies
+    :return: list of ConsumerProducers
+    """
+    timer_bus = Bus(False, name='timer bus')
+    photosensor_bus = Bus((time.perf_counter(), [0, 0, 0]), name='photosensor bus')
+    ultrasonic_bus = Bus((time.perf_counter(), 100), name='ultrasonic bus')
+    photosensor_interp_bus = Bus((time.perf_counter(), 0), name='photosensor interpreter bus')
+    ultrasonic_interp_bus = Bus((time.perf_counter(), ''), name='ultrasonic interpreter bus')
+    stop_bus = Bus(False, name='stop bus')
+    control_bus = Bus(0, name='controller bus')
+
+    def read_photosensor():
+        return time.perf_counter(), [500, 300, 500]
+
+    def read_ultrasonic():
+        return time.perf_counter(), 100
+
+    def interpret_photosensor(reading):
+        stamp, adc_values = reading
+        return stamp, (adc_values[2] - adc_values[0]) / 1000
+
+    def interpret_ultrasonic(reading):
+        stamp, distance = reading
+        return stamp, 'STOP' if distance < 5 else ''
+
+    def stop_car(message):
+        return message[1] == 'STOP'
+
+    def steer(message):
+        stamp, rel_line_pos = message
+        latencies.append(time.perf_counter() - stamp)
+        return rel_line_pos * 10
+
+    def discard(_message):
+        pass
+
+    nodes = [
+        Timer(timer_bus, duration=duration, delay=0.01, termination_busses=timer_bus,
+              name='timer'),
+        Producer(read_photosensor, photosensor_bus, delay=0.01,
+                 termination_busses=timer_bus, name='photosensor producer',
+                 schedule='rate'),
+        Producer(read_ultrasonic, ultrasonic_bus, delay=0.05,
+                 termination_busses=timer_bus, name='ultrasonic producer',
+                 schedule='rate'),
+        ConsumerProducer(interpret_photosensor, photosensor_bus, photosensor_interp_bus,
+                         termination_busses=timer_bus, name='photosensor interpreter',
+                         schedule='input'),
+        ConsumerProducer(interpret_ultrasonic, ultrasonic_bus, ultrasonic_interp_bus,
+                         termination_busses=timer_bus, name='ultrasonic interpreter',
+                         schedule='input'),
+        ConsumerProducer(stop_car, ultrasonic_interp_bus, stop_bus,
+                         termination_busses=timer_bus, name='stop controller',
+                         schedule='input'),
+        ConsumerProducer(steer, photosensor_interp_bus, control_bus,
+                         termination_busses=(timer_bus, stop_bus), name='line controller',
+                         schedule='input'),
+    ]
+    for bus in (photosensor_bus, ultrasonic_bus, control_bus, stop_bus):
+        nodes.append(Consumer(discard, bus, termination_busses=timer_bus,
+                              name='printer', schedule='input'))
+    return nodes
+
+
+def bench_executor(run, duration=1.0):
+    """
+    Runs the simulated line following graph with the given executor
+    :return: tuple, (mean latency, 99th percentile latency, CPU fraction),
+        with CPU time counted across all threads of the process
+    """
+    latencies = []
+    nodes = build_line_following_graph(duration, latencies)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    run(nodes)
+    cpu = (time.process_time() - cpu_start) / (time.perf_counter() - wall_start)
+    latencies.sort()
+    mean = sum(latencies) / len(latencies)
+    p99 = latencies[int(0.99 * (len(latencies) - 1))]
+    return mean, p99, cpu
+
+
+def print_executors(duration):
+    print('Executors (simulated 11 node line following graph)')
+    print('{:>14s} {:>16s} {:>16s} {:>8s}'.format('executor', 'mean latency ms', 'p99 latency ms', 'CPU %'))
+    for name, run in (('threads', runConcurrently), ('cooperative', runCooperatively)):
+        mean, p99, cpu = bench_executor(run, duration)
+        print('{:>14s} {:>16.3f} {:>16.3f} {:>8.1f}'.format(name, mean * 1000, p99 * 1000, cpu * 100))
+
+
+BENCHMARKS = {
+    'instrumentation': print_instrumentation,
+    'contention': print_contention,
+    'executors': print_executors,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='rossros bus benchmarks')
+    parser.add_argument('benchmarks', nargs='*',
+                        help='benchmarks to run, from {} (default: all)'.format(
+                            ', '.join(BENCHMARKS)))
+    parser.add_argument('--duration', type=float, default=1.0,
+                        help='seconds to run each measurement for')
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark {!r}'.format(name))
+    for name in args.benchmarks or BENCHMARKS:
+        BENCHMARKS[name](args.duration)
+        print()
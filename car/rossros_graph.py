@@ -0,0 +1,241 @@
+#! /usr/bin/python3
+"""
+rossros_graph.py
+
+Collects rossros nodes into a graph that is checked before it is run, so
+that wiring mistakes show up when the program starts instead of as threads
+that spin on busses nothing writes:
+
+    graph = Graph()
+    graph.add(photosensor_producer)
+    graph.add(photosensor_con_prod)
+    graph.add(controller_con_prod, keep=True)
+    graph.run()
+
+Before running, the graph
+  - checks that every input and termination "bus" is actually a bus, and
+    that every bus a node reads has a writer in the graph
+  - rejects cycles between nodes' output and input busses
+  - removes nodes whose output busses nobody reads, repeatedly, since that
+    can leave their own writers unread. Nodes that only consume, and nodes
+    added with keep=True (e.g. ones that drive motors), are never removed
+  - logs how many threads it will use and how often its nodes will wake up
+"""
+
+import functools
+import logging
+import math
+from collections import namedtuple
+
+from rossros import default_input_bus, default_output_bus, default_termination_bus, \
+    runConcurrently, runCooperatively
+
+# The default busses stand in for "no bus", so they never count as read or written
+DEFAULT_BUSSES = (default_input_bus, default_output_bus, default_termination_bus)
+
+GraphReport = namedtuple('GraphReport', ['nodes', 'removed', 'threads', 'wakeup_rates'])
+
+
+def isBus(bus):
+    """ Function that checks whether an object has the interface nodes use on busses"""
+    return all(hasattr(bus, attr) for attr in ('get_message', 'set_message', 'get_snapshot'))
+
+
+class Graph:
+    """
+    Set of ConsumerProducers that is validated, pruned of dead nodes and
+    reported on before it is run
+    """
+
+    def __init__(self, producer_consumer_list=()):
+        self.nodes = []
+        self.kept = set()
+        for cp in producer_consumer_list:
+            self.add(cp)
+
+    def add(self, node, keep=False):
+        """
+        Adds a ConsumerProducer to the graph
+        :param keep: bool, never remove the node as dead, e.g. because its
+            function has side effects or its output busses are read outside
+            the graph
+        :return: the node, to allow graph.add(ConsumerProducer(...))
+        """
+        self.nodes.append(node)
+        if keep:
+            self.kept.add(node)
+        return node
+
+    @staticmethod
+    def readBusses(cp):
+        return [bus for bus in cp.input_busses + cp.termination_busses if bus not in DEFAULT_BUSSES]
+
+    @staticmethod
+    def writtenBusses(cp):
+        return [bus for bus in cp.output_busses if bus not in DEFAULT_BUSSES]
+
+    def writers(self, nodes):
+        """
+        :return: dict, {bus: list of the nodes that write it}
+        """
+        writers = {}
+        for cp in nodes:
+            for bus in self.writtenBusses(cp):
+                writers.setdefault(bus, []).append(cp)
+        return writers
+
+    def validate(self):
+        """
+        Raises a ValueError listing every input or termination bus that is
+        not a bus or has no writer, and every cycle between nodes
+        """
+        problems = []
+        for cp in self.nodes:
+            for bus in cp.input_busses + cp.termination_busses + cp.output_busses:
+                if not isBus(bus):
+                    problems.append("{0} is wired to a {1}, which is not a bus".format(
+                        cp.name, type(bus).__name__))
+
+        writers = self.writers(self.nodes)
+        for cp in self.nodes:
+            for bus in self.readBusses(cp):
+                if isBus(bus) and bus not in writers:
+                    problems.append("{0} reads {1}, which no node writes".format(cp.name, bus.name))
+
+        cycle = self.findCycle()
+        if cycle:
+            problems.append("cycle between nodes: {0}".format(" -> ".join(cp.name for cp in cycle)))
+
+        if problems:
+            raise ValueError("Invalid rossros graph:\n  " + "\n  ".join(problems))
+
+    def findCycle(self):
+        """
+        Looks for a loop of nodes, each writing an input bus of the next.
+        Termination busses are left out, since stopping is not data flow
+        :return: list of the nodes in the cycle, starting and ending with the
+            same node, or None if there is none
+        """
+        writers = self.writers(self.nodes)
+        readers = {cp: [w for bus in cp.input_busses for w in writers.get(bus, ())]
+                   for cp in self.nodes}
+
+        # Depth first search over "is read by" edges, tracking the current path
+        finished = set()
+        for root in self.nodes:
+            if root in finished:
+                continue
+            path = [root]
+            on_path = {root}
+            stack = [iter(readers[root])]
+            while stack:
+                upstream = next(stack[-1], None)
+                if upstream is None:
+                    stack.pop()
+                    finished.add(path[-1])
+                    on_path.discard(path.pop())
+                elif upstream in on_path:
+                    cycle = path[path.index(upstream):] + [upstream]
+                    cycle.reverse()
+                    return cycle
+                elif upstream not in finished:
+                    path.append(upstream)
+                    on_path.add(upstream)
+                    stack.append(iter(readers[upstream]))
+        return None
+
+    def prune(self):
+        """
+        Removes nodes that write busses but have none of them read by
+        another node, until no more can be removed
+        :return: list of the removed nodes
+        """
+        removed = []
+        while True:
+            read = {bus for cp in self.nodes for bus in self.readBusses(cp)}
+            dead = [cp for cp in self.nodes
+                    if cp not in self.kept and self.writtenBusses(cp)
+                    and not any(bus in read for bus in self.writtenBusses(cp))]
+            if not dead:
+                return removed
+            for cp in dead:
+                self.nodes.remove(cp)
+            removed.extend(dead)
+
+    def wakeupRates(self):
+        """
+        Estimates how many times per second each node runs. 'delay' and
+        'rate' nodes run every delay seconds (without bound if delay is 0),
+        and 'input' nodes run whenever one of their input or termination
+        busses is written, at most once per delay seconds
+        :return: dict, {node: wakeups per second}
+        """
+        writers = self.writers(self.nodes)
+        rates = {}
+
+        def rate(cp):
+            if cp not in rates:
+                cap = 1 / cp.delay if cp.delay else math.inf
+                if cp.schedule == 'input':
+                    # Acyclic, so this recursion ends; mark the node first anyway
+                    rates[cp] = 0.0
+                    incoming = sum(rate(w) for bus in self.readBusses(cp) for w in writers.get(bus, ()))
+                    rates[cp] = min(incoming, cap)
+                else:
+                    rates[cp] = cap
+            return rates[cp]
+
+        for cp in self.nodes:
+            rate(cp)
+        return rates
+
+    @staticmethod
+    def threadCount(nodes, executor):
+        """
+        :param executor: function the nodes will be run with
+        :return: int, number of threads the executor runs nodes on.
+            runCooperatively (or a functools.partial of it with a
+            threaded_list) uses the calling thread plus one per threaded
+            node; anything else is taken to use one per node, as
+            runConcurrently does
+        """
+        if executor is runCooperatively:
+            return 1
+        if isinstance(executor, functools.partial) and executor.func is runCooperatively:
+            threaded_list = executor.keywords.get('threaded_list', ())
+            return 1 + sum(1 for cp in threaded_list if cp in nodes)
+        return len(nodes)
+
+    def build(self, executor=runConcurrently):
+        """
+        Validates and prunes the graph
+        :param executor: function the nodes will be run with, to count the
+            threads it uses
+        :return: GraphReport with the remaining nodes, the removed ones, the
+            number of threads executor will use, and the wakeup rate of
+            every remaining node
+        """
+        self.validate()
+        removed = self.prune()
+        return GraphReport(list(self.nodes), removed, self.threadCount(self.nodes, executor),
+                           self.wakeupRates())
+
+    def describe(self, report):
+        lines = ["rossros graph: {0} nodes on {1} threads, {2:.1f} wakeups/sec".format(
+            len(report.nodes), report.threads, sum(report.wakeup_rates.values()))]
+        for cp in report.nodes:
+            lines.append("  {0:<45s} {1:>6s} {2:>10.1f}/sec".format(
+                cp.name, cp.schedule, report.wakeup_rates[cp]))
+        for cp in report.removed:
+            lines.append("  removed {0}: nothing reads its output".format(cp.name))
+        return "\n".join(lines)
+
+    def run(self, executor=runConcurrently):
+        """
+        Builds the graph, logs its report and runs the remaining nodes
+        :param executor: function used to run the nodes, runConcurrently or
+            runCooperatively
+        """
+        report = self.build(executor)
+        logging.info(self.describe(report))
+        executor(report.nodes)
@@ -0,0 +1,295 @@
+#! /usr/bin/python3
+"""
+rossros_mp.py
+
+Runs rossros graphs across several processes, so that CPU-heavy nodes (such
+as camera line detection) do not hold the GIL that the sensor loops need.
+
+Busses that cross a process boundary are SharedBusses, whose messages live
+in fixed-size shared memory slots instead of being pickled: scalars, short
+arrays such as ADC triples, or whole camera frames. Placement is declared
+when the graph is built:
+
+    graph = ProcessGraph()
+    frame_bus = SharedBus(name='frame bus', shape=(480, 640, 3), dtype='uint8')
+    graph.add(camera_producer)
+    graph.add(lane_detector, process='vision')
+    graph.run()
+
+Every node should use graph.termination_bus (alone or with other shared
+termination busses), which is set as soon as any process stops.
+"""
+
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from logdecorator import log_on_start, log_on_end, log_on_error
+
+from rossros import DEBUG, Bus, default_input_bus, default_output_bus, \
+    default_termination_bus, runConcurrently
+
+# started count, completed count, and a None flag for each of the two slots
+HEADER = np.dtype([('started', np.int64),
+                   ('completed', np.int64),
+                   ('is_none', np.int64, (2,))])
+SLOT_ALIGNMENT = 64
+
+
+class SharedBus:
+    """
+    Single element bus whose message lives in shared memory, so it can be
+    read and written by nodes in different processes. It has the same
+    get_message/set_message/get_snapshot interface as Bus.
+
+    The message must fit the slot given by shape and dtype (a scalar when
+    shape is (), e.g. dtype=bool for termination busses, or a fixed-size
+    numpy array), or be None. Scalars are returned as Python values and
+    arrays as numpy arrays.
+
+    The bus holds two slots. A write fills the slot that is not being
+    published and then publishes it, so readers never see a half-written
+    message. Readers copy the message out by default; with copy=False they
+    get a view of the slot instead, which stays valid until the writer has
+    written twice more. Writes are only safe from one process at a time,
+    unless the bus is made with multi_writer=True, which puts a
+    multiprocessing.Lock around them.
+
+    Because writes in other processes cannot set a threading.Event, nodes
+    reading SharedBusses cannot use the 'input' schedule.
+    """
+
+    def __init__(self, initial_message=0, name="Unnamed Bus", shape=(), dtype='float64',
+                 copy=True, multi_writer=False):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.copy = copy
+        self.write_lock = multiprocessing.Lock() if multi_writer else None
+
+        slot_size = max(1, int(np.prod(self.shape, dtype=np.int64)) * self.dtype.itemsize)
+        self._slot_stride = -(-slot_size // SLOT_ALIGNMENT) * SLOT_ALIGNMENT
+        self._header_size = -(-HEADER.itemsize // SLOT_ALIGNMENT) * SLOT_ALIGNMENT
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=self._header_size + 2 * self._slot_stride)
+        self._owner = True
+        self._attach()
+
+        self._header['started'] = 0
+        self._header['completed'] = 0
+        self._write_slot(0, initial_message)
+
+    def _attach(self):
+        self._header = np.ndarray((), HEADER, buffer=self._shm.buf)
+        self._slots = [np.ndarray(self.shape, self.dtype, buffer=self._shm.buf,
+                                  offset=self._header_size + i * self._slot_stride)
+                       for i in range(2)]
+
+    # Allow the bus to be handed to processes that are spawned rather than forked
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ('_shm', '_header', '_slots'):
+            del state[key]
+        state['_shm_name'] = self._shm.name
+        return state
+
+    def __setstate__(self, state):
+        shm_name = state.pop('_shm_name')
+        self.__dict__.update(state)
+        self._shm = shared_memory.SharedMemory(name=shm_name)
+        self._owner = False
+        self._attach()
+
+    @property
+    def message(self):
+        return self.get_snapshot(self.name)[1]
+
+    @property
+    def version(self):
+        return int(self._header['completed'])
+
+    def _write_slot(self, slot, message):
+        if message is None:
+            self._header['is_none'][slot] = 1
+        else:
+            self._slots[slot][...] = message
+            self._header['is_none'][slot] = 0
+
+    def _read_slot(self, slot):
+        if self._header['is_none'][slot]:
+            return None
+        if not self.shape:
+            return self._slots[slot].item()
+        if self.copy:
+            return self._slots[slot].copy()
+        return self._slots[slot]
+
+    def get_message(self, _name):
+
+        return self.get_snapshot(_name)[1]
+
+    def set_message(self, message, _name):
+
+        if self.write_lock is not None:
+            with self.write_lock:
+                self._publish(message)
+        else:
+            self._publish(message)
+
+    def _publish(self, message):
+
+        # Announce the write, fill the slot that readers are not looking at,
+        # then publish it
+        started = int(self._header['started']) + 1
+        self._header['started'] = started
+        self._write_slot(started % 2, message)
+        self._header['completed'] = started
+
+    def get_snapshot(self, _name):
+        """
+        Returns the current message together with its version number
+        :return: tuple, (version, message)
+        """
+        while True:
+            completed = int(self._header['completed'])
+            message = self._read_slot(completed % 2)
+
+            # The slot just read is only rewritten by the second write after
+            # it was published, so the read is good unless that has started
+            if int(self._header['started']) <= completed + 1:
+                return completed, message
+
+    def add_listener(self, event):
+        raise ValueError("{0}: SharedBus writes cannot notify listeners, so nodes reading "
+                         "it cannot use the 'input' schedule".format(self.name))
+
+    def remove_listener(self, event):
+        pass
+
+    def close(self):
+        """
+        Releases this process's mapping of the bus, and frees the shared
+        memory if this is the process that created it
+        """
+        self._header = None
+        self._slots = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def _run_process(producer_consumer_list, termination_bus, executor):
+    """
+    Entry point of each worker process. Whatever the reason it stops, it
+    sets the shared termination bus so the rest of the graph stops too
+    """
+    try:
+        executor(producer_consumer_list)
+    finally:
+        termination_bus.set_message(True, multiprocessing.current_process().name)
+
+
+class ProcessGraph:
+    """
+    Collects rossros nodes together with the name of the process each should
+    run in. Nodes placed in the main process run in the process that calls
+    run(); each other process name gets its own worker process.
+    """
+
+    MAIN_PROCESS = 'main'
+
+    def __init__(self, termination_bus=None, executor=runConcurrently):
+        """
+        :param termination_bus: SharedBus, bus that stops every process when
+            set to True. Every process writes to it, so it should be made
+            with multi_writer=True. A new boolean SharedBus is made if None
+        :param executor: function used to run each process's nodes,
+            runConcurrently or runCooperatively
+        """
+        if termination_bus is None:
+            termination_bus = SharedBus(False, name='graph termination bus', dtype=bool,
+                                        multi_writer=True)
+        self.termination_bus = termination_bus
+        self.executor = executor
+        self.placement = {}
+
+    def add(self, node, process=MAIN_PROCESS):
+        """
+        Places a ConsumerProducer in the named process
+        :return: the node, to allow graph.add(ConsumerProducer(...))
+        """
+        self.placement.setdefault(process, []).append(node)
+        return node
+
+    def check_busses(self):
+        """
+        Raises a ValueError if a Bus that only exists in one process's memory
+        is used by nodes placed in different processes
+        """
+        # The default busses are never written (input, termination) or never
+        # read (output), so each process having its own copy is harmless
+        default_busses = (default_input_bus, default_output_bus, default_termination_bus)
+
+        users = {}
+        for process, nodes in self.placement.items():
+            for cp in nodes:
+                for bus in cp.input_busses + cp.output_busses + cp.termination_busses:
+                    users.setdefault(bus, set()).add(process)
+
+        for bus, processes in users.items():
+            if isinstance(bus, Bus) and len(processes) > 1 and bus not in default_busses:
+                raise ValueError("{0} is used by processes {1}, so it should be a SharedBus".format(
+                    bus.name, sorted(processes)))
+
+    def shared_busses(self):
+        """
+        :return: set of the SharedBusses used by the graph's nodes
+        """
+        busses = {self.termination_bus}
+        for nodes in self.placement.values():
+            for cp in nodes:
+                for bus in cp.input_busses + cp.output_busses + cp.termination_busses:
+                    if isinstance(bus, SharedBus):
+                        busses.add(bus)
+        return busses
+
+    @log_on_start(DEBUG, "ProcessGraph: Starting multi-process execution")
+    @log_on_error(DEBUG, "ProcessGraph: Encountered an error during multi-process execution")
+    @log_on_end(DEBUG, "ProcessGraph: Finished multi-process execution")
+    def run(self):
+        """
+        Starts a worker process for every non-main process name, runs the
+        main process's nodes here, and waits for everything to stop. The
+        shared memory of the graph's busses is freed afterwards.
+        """
+        self.check_busses()
+
+        # Fork, so nodes (and the hardware objects behind their functions)
+        # do not need to be picklable
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=_run_process,
+                                     args=(nodes, self.termination_bus, self.executor),
+                                     name=process)
+                     for process, nodes in self.placement.items()
+                     if process != self.MAIN_PROCESS]
+        for p in processes:
+            p.start()
+
+        main_nodes = self.placement.get(self.MAIN_PROCESS)
+        try:
+            if main_nodes:
+                # However the main process's nodes stop, tell the workers to
+                # stop too, as each worker does for the rest of the graph
+                try:
+                    self.executor(main_nodes)
+                finally:
+                    self.termination_bus.set_message(True, self.MAIN_PROCESS)
+
+            # Without main nodes, the first worker to stop stops the rest
+            for p in processes:
+                p.join()
+                if p.exitcode:
+                    logging.error("ProcessGraph: process %s exited with code %s", p.name, p.exitcode)
+        finally:
+            for bus in self.shared_busses():
+                bus.close()
@@ -0,0 +1,40 @@
+"""
+rossros_mp_test.py
+
+Checks how a ProcessGraph stops: when its main process has no nodes, the
+worker processes keep running until one of them stops the graph.
+
+    python3 -m pytest rossros_mp_test.py
+"""
+
+import time
+
+from rossros import Producer, Timer
+from rossros_mp import ProcessGraph, SharedBus
+
+DURATION = 1
+
+
+def worker_only_graph():
+    # A Timer in one worker stops the graph, a Producer in another runs until then
+    graph = ProcessGraph()
+    stamp_bus = SharedBus(0, name='stamp bus')
+    graph.add(Timer(graph.termination_bus, duration=DURATION, delay=0.01,
+                    termination_busses=graph.termination_bus, name='timer'), process='w1')
+    graph.add(Producer(time.monotonic, stamp_bus, 0.01, graph.termination_bus,
+                       name='stamp producer'), process='w2')
+    return graph
+
+
+def test_worker_only_graph_runs_until_a_worker_stops_it():
+    graph = worker_only_graph()
+    start = time.monotonic()
+    graph.run()
+    assert time.monotonic() - start >= DURATION
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name, 'passed')
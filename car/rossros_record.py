@@ -0,0 +1,302 @@
+#! /usr/bin/python3
+"""
+rossros_record.py
+
+Records the messages written to rossros busses, and plays them back, so a
+graph can be run offline against the sensor readings of a real drive.
+
+    recorder = BusRecorder('drive.rrlog', [adc_bus, ultrasonic_bus, frame_bus])
+    with recorder:
+        runConcurrently(nodes)
+
+    replay = ReplayProducer('drive.rrlog', [adc_bus, ultrasonic_bus, frame_bus],
+                            speed=None, end_busses=termination_bus)
+    runConcurrently([replay] + interpreters_and_controllers)
+
+The log is an append-only binary file. Each record holds the monotonic time
+of the write, the bus and writer names, and the message. Messages are
+pickled, except numpy arrays (such as camera frames), which are appended raw
+to a side file (the log path plus '.frames') and referenced by offset. The
+files are written by a background thread, so a recorded write only costs
+the graph a copy of the message. At most max_queued messages wait for that
+thread; if the disk falls further behind, new messages are dropped from the
+log (and counted in BusRecorder.dropped) rather than using up the memory.
+"""
+
+import logging
+import pickle
+import queue
+import struct
+import threading
+import time
+from collections import namedtuple
+import numpy as np
+from logdecorator import log_on_start, log_on_end, log_on_error
+
+from rossros import DEBUG, Producer, default_termination_bus, ensureTuple
+
+LOG_MAGIC = b'RRLOG1\n'
+FRAMES_SUFFIX = '.frames'
+
+# time, bus name index, writer name index, record kind, payload length
+RECORD_HEADER = struct.Struct('<dHHBI')
+NAME_RECORD = 0  # payload is a utf-8 name, given the next free index
+PICKLE_RECORD = 1  # payload is the pickled message
+ARRAY_RECORD = 2  # payload is the pickled (dtype, shape, offset) of an array in the side file
+
+BusRecord = namedtuple('BusRecord', ['time', 'bus', 'writer', 'message'])
+
+
+class BusRecorder:
+    """
+    Captures every set_message on a set of busses to a log file, from
+    start() until stop(). Can also be used as a context manager.
+
+    Recording replaces each bus's set_message with a wrapper, so it should
+    be started after any other change to the busses' accessors (such as
+    Bus.enable_profiling) and stopped before them being undone.
+    """
+
+    def __init__(self, path, busses, max_queued=64):
+        """
+        :param path: str, log file to write; it is overwritten
+        :param busses: Bus or tuple of Busses to record
+        :param max_queued: int, messages that can wait to be written before
+            new ones are dropped
+        """
+        self.path = path
+        self.busses = ensureTuple(busses)
+        self.records = 0
+        self.dropped = 0  # messages not recorded because the queue was full
+        self._dropped_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread = None
+        self._original_setters = {}
+
+    def start(self):
+        if self._thread is not None:
+            raise ValueError("BusRecorder for {0} has already been started".format(self.path))
+
+        self._thread = threading.Thread(target=self._write_log, name='BusRecorder', daemon=True)
+        self._thread.start()
+
+        for bus in self.busses:
+            self._original_setters[bus] = bus.set_message
+            bus.set_message = self._recording_setter(bus, bus.set_message)
+
+    def stop(self):
+        """
+        Restores the busses' set_message and waits until every captured
+        message has been written out
+        """
+        for bus, set_message in self._original_setters.items():
+            bus.set_message = set_message
+        self._original_setters = {}
+
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+        if self.dropped:
+            logging.warning("BusRecorder: dropped %d of %d messages to %s, the log could not "
+                            "be written fast enough", self.dropped, self.dropped + self.records,
+                            self.path)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _recording_setter(self, bus, set_message):
+
+        put = self._queue.put_nowait
+        bus_name = bus.name
+
+        def recording_set_message(message, _name):
+            set_message(message, _name)
+
+            # Drop the message rather than wait for the disk
+            if self._queue.full():
+                self._drop()
+                return
+
+            # The writer may reuse its array, so keep a copy of it as written
+            if isinstance(message, np.ndarray):
+                message = message.copy()
+            try:
+                put((time.monotonic(), bus_name, _name, message))
+            except queue.Full:
+                self._drop()
+
+        return recording_set_message
+
+    def _drop(self):
+        # Busses are written from several threads
+        with self._dropped_lock:
+            self.dropped += 1
+
+    def _write_log(self):
+
+        name_indices = {}
+
+        with open(self.path, 'wb') as log, open(self.path + FRAMES_SUFFIX, 'wb') as frames:
+            log.write(LOG_MAGIC)
+
+            def name_index(name):
+                if name not in name_indices:
+                    name_indices[name] = len(name_indices)
+                    payload = str(name).encode('utf-8')
+                    log.write(RECORD_HEADER.pack(0.0, 0, 0, NAME_RECORD, len(payload)))
+                    log.write(payload)
+                return name_indices[name]
+
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                stamp, bus_name, writer_name, message = item
+
+                bus_index = name_index(bus_name)
+                writer_index = name_index(writer_name)
+                if isinstance(message, np.ndarray):
+                    message = np.ascontiguousarray(message)
+                    payload = pickle.dumps((message.dtype.str, message.shape, frames.tell()))
+                    frames.write(message.data)
+                    kind = ARRAY_RECORD
+                else:
+                    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+                    kind = PICKLE_RECORD
+
+                log.write(RECORD_HEADER.pack(stamp, bus_index, writer_index, kind, len(payload)))
+                log.write(payload)
+                self.records += 1
+
+
+def read_log(path):
+    """
+    Reads a log written by BusRecorder
+    :param path: str, log file to read
+    :return: list of BusRecords, in the order they were written. Arrays are
+        read-only views of the side file
+    """
+    with open(path, 'rb') as log:
+        data = log.read()
+    if not data.startswith(LOG_MAGIC):
+        raise ValueError("{0} is not a rossros bus log".format(path))
+
+    frames = None
+    names = []
+    records = []
+    position = len(LOG_MAGIC)
+    while position < len(data):
+        stamp, bus_index, writer_index, kind, length = RECORD_HEADER.unpack_from(data, position)
+        position += RECORD_HEADER.size
+        payload = data[position:position + length]
+        position += length
+
+        if kind == NAME_RECORD:
+            names.append(payload.decode('utf-8'))
+            continue
+
+        if kind == ARRAY_RECORD:
+            dtype, shape, offset = pickle.loads(payload)
+            if frames is None:
+                frames = np.memmap(path + FRAMES_SUFFIX, dtype=np.uint8, mode='r')
+            dtype = np.dtype(dtype)
+            size = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+            message = frames[offset:offset + size].view(dtype).reshape(shape)
+        else:
+            message = pickle.loads(payload)
+
+        records.append(BusRecord(stamp, names[bus_index], names[writer_index], message))
+
+    return records
+
+
+class ReplayProducer(Producer):
+    """
+    ReplayProducer is a producer that writes the messages of a BusRecorder
+    log back to the busses with the same names, at the recorded pace scaled
+    by speed, or as fast as possible if speed is None. Records for busses
+    that were not given are skipped.
+
+    It writes each message to its own bus rather than dealing a value to
+    every output bus on each step, so it runs its own loop and should be
+    given a thread (e.g. in runCooperatively's threaded_list). Stepping it
+    raises a ValueError.
+    """
+
+    @log_on_start(DEBUG, "{name:s}: Starting to create replay producer")
+    @log_on_error(DEBUG, "{name:s}: Encountered an error while creating replay producer")
+    @log_on_end(DEBUG, "{name:s}: Finished creating replay producer")
+    def __init__(self,
+                 path,  # log file written by a BusRecorder
+                 output_busses,  # busses to replay into, matched to the log by name
+                 speed=1.0,  # playback speed relative to the recording, None for as fast as possible
+                 end_busses=(),  # busses that should be set to true when the log is exhausted
+                 termination_busses=default_termination_bus,
+                 name="Unnamed replay producer"):
+
+        if speed is not None and speed <= 0:
+            raise ValueError("speed should be positive or None, not {0}".format(speed))
+
+        super().__init__(
+            lambda: None,  # unused, messages are written by the replay loop
+            output_busses,
+            0,
+            termination_busses,
+            name)
+
+        self.speed = speed
+        self.end_busses = ensureTuple(end_busses)
+        self.busses_by_name = {bus.name: bus for bus in self.output_busses}
+        self.records = [r for r in read_log(path) if r.bus in self.busses_by_name]
+        self.replayed = 0
+
+    @log_on_start(DEBUG, "{self.name:s}: Starting replay")
+    @log_on_error(DEBUG, "{self.name:s}: Encountered an error while replaying")
+    @log_on_end(DEBUG, "{self.name:s}: Finished replay")
+    def __call__(self):
+
+        if not self.records:
+            self.signalEnd()
+            return
+
+        t_recorded = self.records[0].time
+        t_start = time.monotonic()
+
+        for record in self.records:
+
+            if self.checkTerminationBusses():
+                return
+
+            # Wait for the record's time in the replay, in short enough
+            # sleeps to notice termination during long gaps
+            if self.speed is not None:
+                due = t_start + (record.time - t_recorded) / self.speed
+                while True:
+                    remaining = due - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    time.sleep(min(remaining, 0.05))
+                    if self.checkTerminationBusses():
+                        return
+
+            self.busses_by_name[record.bus].set_message(record.message, self.name)
+            self.replayed += 1
+
+        self.signalEnd()
+
+    def runStep(self, input_values=None):
+        raise ValueError("{0}: a ReplayProducer runs its own loop and cannot be stepped, "
+                         "put it in runCooperatively's threaded_list".format(self.name))
+
+    # Profiling rebinds runStep to this, which would step the node too
+    _profiledRunStep = runStep
+
+    def signalEnd(self):
+        for bus in self.end_busses:
+            bus.set_message(True, self.name)
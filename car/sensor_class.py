@@ -5,14 +5,12 @@ Written Nicole Fronda - April 2021
 Produces readings for the sensors on the PiCar
 """
 
-import cv2
 import logging
 from threading import Lock
 import time
 
 
 try:
-    from ezblock import ADC
     from ezblock import __reset_mcu__
     __reset_mcu__()
     time.sleep(0.01)
@@ -21,20 +19,29 @@ except ImportError:
           'is not present). Shadowing hardware call swith substitute functions')
     from sim_ezblock import *
 
+from adc_group import ADCGroup
+from camera_capture import CameraCapture
+
 '''BEGIN LOGGING SETUP'''
 logging_format = "%(asctime)s: %(message)s"
 logging.basicConfig(format=logging_format, level=logging.INFO,
                     datefmt ="%H:%M:%S")
 '''END LOGGING SETUP'''
 
+# Frames the camera captures into before reusing a buffer: about a quarter
+# of a second at 30 fps, so a frame handed out by get_camera_frame outlives
+# its processing
+CAMERA_POOL_SIZE = 8
+
 
 class Sensor:
     def __init__(self, logging_on=False):
-        self.adc = [ADC('A0'), ADC('A1'), ADC('A2')]
+        self.adc = ADCGroup(('A0', 'A1', 'A2'))
         self.ultrasonic_trig = Pin('D0')
         self.ultrasonic_echo = Pin('D1')
         self.logging = logging_on
-        self.cam = cv2.VideoCapture(0)
+        # opened by the first get_camera_frame
+        self.camera = CameraCapture(0, pool_size=CAMERA_POOL_SIZE)
         if self.logging:
             self.toggle_logging()
 
@@ -50,9 +57,14 @@ class Sensor:
         """
         sensor returns high value for lighter value
         approximately (200-500 black, 1100-1200 for white)
+
+        The three channels are read by an ADCGroup without block reads, so
+        a reading still takes 9 I2C transactions (a select and two byte
+        reads per channel), as ezblock's ADC did; it saves the per call
+        overhead around them
         :return: list of three ADC values
         """
-        return [adc.read() for adc in self.adc]
+        return self.adc.read_list()
 
     def get_collision_distance(self, timeout=0.02):
         """
@@ -89,11 +101,18 @@ class Sensor:
 
     def get_camera_frame(self):
         """
-        Wrapper around camera.read() from cv2 to return current frame
-        :return: frame, matrix of pixel values
+        Returns the newest frame captured by the camera's background thread,
+        opening the camera on the first call.
+
+        The frame is not a copy: its buffer is captured into again after
+        CAMERA_POOL_SIZE - 1 newer frames (about 230 ms at 30 fps), so it
+        should be processed within that time, or copied to keep it longer.
+        self.camera.read() gives the frame with its sequence number, for
+        callers that need to check it has not been overwritten.
+        :return: frame, matrix of pixel values, or None without a camera
         """
-        _, frame = self.cam.read()
-        return frame
+        frame = self.camera.read()
+        return None if frame is None else frame.image
 
     def get_sensor_reading(self, sensor_type='photosensor'):
         """
@@ -1,4 +1,6 @@
 import logging
+import threading
+import time
 
 class Servo():
     def __init__(self, pwm):
@@ -9,26 +11,36 @@ class Servo():
         pass
 
 class I2C():
+    # Every simulated bus transaction adds one, across all instances, since
+    # they share the one physical bus. Reset it to measure a piece of code
+    transactions = 0
+
     def __init__(self, *args, **kargs):
         pass
 
     def _i2c_write_byte(self, addr, data):
+        I2C.transactions += 1
         return 0
 
     def _i2c_write_byte_data(self, addr, reg, data):
+        I2C.transactions += 1
         return 0
 
     def _i2c_write_word_data(self, addr, reg, data):
+        I2C.transactions += 1
         return 0
 
     def _i2c_write_i2c_block_data(self, addr, reg, data):
+        I2C.transactions += 1
         return 0
 
     def _i2c_read_byte(self, addr):
+        I2C.transactions += 1
         return 0
 
     def _i2c_read_i2c_block_data(self, addr, reg, num):
-        return 0
+        I2C.transactions += 1
+        return [0] * num
 
     def is_ready(self, addr):
         return True
@@ -36,11 +48,31 @@ class I2C():
     def scan(self):
         return []
 
+    # send and recv split data into transactions the same way as ezblock's
     def send(self, send, addr, timeout=0):
+        if isinstance(send, int):
+            send = [send]
+        data_all = list(send)
+        if len(data_all) == 1:
+            self._i2c_write_byte(addr, data_all[0])
+        elif len(data_all) == 2:
+            self._i2c_write_byte_data(addr, data_all[0], data_all[1])
+        elif len(data_all) == 3:
+            self._i2c_write_word_data(addr, data_all[0], (data_all[2] << 8) + data_all[1])
+        else:
+            self._i2c_write_i2c_block_data(addr, data_all[0], data_all[1:])
         return 0
 
     def recv(self, recv, addr=0x00, timeout=0):
-        return False
+        if isinstance(recv, int):
+            result = bytearray(recv)
+        elif isinstance(recv, bytearray):
+            result = recv
+        else:
+            return False
+        for i in range(len(result)):
+            result[i] = self._i2c_read_byte(addr)
+        return result
 
     def mem_write(self, data, addr, memaddr, timeout=5000, addr_size=8):
         return 0
@@ -127,12 +159,63 @@ class Pin():
         def __init__(self):
             pass
 
+class IRQ():
+    IRQ_FALLING = 'falling'
+    IRQ_RISING = 'rising'
+    IRQ_RISING_FALLING = 'both'
+
+    def __init__(self, pin, trigger, callback):
+        self.pin = pin
+        self.trigger = trigger
+        self.callback = callback
+
+    def disable(self):
+        pass
+
+    def enable(self):
+        pass
+
+    def line(self):
+        pass
+
+    def swint(self):
+        self.callback(self.pin)
+
+    def inject_pulse(self, width, delay=0.0):
+        """
+        Simulates a pulse on the pin from another thread, as GPIO edge
+        callbacks arrive: a rising edge after delay seconds and a falling
+        edge width seconds later, each passed to the callback if the
+        trigger asks for it
+        :return: the thread delivering the edges, to join if needed
+        """
+        def deliver():
+            time.sleep(delay)
+            if self.trigger != self.IRQ_FALLING:
+                self.callback(self.pin)
+            time.sleep(width)
+            if self.trigger != self.IRQ_RISING:
+                self.callback(self.pin)
+
+        thread = threading.Thread(target=deliver, daemon=True)
+        thread.start()
+        return thread
+
 class ADC(I2C):
+    ADDR = 0x14
+
     def __init__(self, chn):
         super().__init__()
+        if isinstance(chn, str):
+            chn = int(chn[1:])
+        self.chn = (7 - chn) | 0x10
 
+    # Same transactions as ezblock's ADC.read: a channel select, then two byte reads
     def read(self):
-        return 0
+        self.send([self.chn, 0, 0], self.ADDR)
+        value_h = self.recv(1, self.ADDR)[0]
+        value_l = self.recv(1, self.ADDR)[0]
+        return (value_h << 8) + value_l
 
     def read_voltage(self):
-        return 0
+        return self.read() * 3.3 / 4095
@@ -0,0 +1,126 @@
+"""
+track_sim.py
+
+Deterministic simulation of the PiCar following a line around a track, to
+compare speed strategies without hardware. The same track, sensor noise
+(from a fixed seed) and timing are replayed for every run.
+
+The car is a kinematic bicycle whose steering servo lags its command. The
+grayscale sensors report the line's offset from the car's centre as a
+relative line position, with noise, and None once the line is out of reach,
+which ends the lap as lost. Turning faster than the tyres' grip allows
+makes the car slide wide, so curves have a speed limit. Steering uses
+SteeringController and speed either a fixed value or a SpeedPlanner.
+
+    python3 track_sim.py
+"""
+
+import math
+import numpy as np
+
+from controller_class import SpeedPlanner, SteeringController
+
+WHEELBASE = 9.5  # cm
+SPEED_SCALE = 0.5  # cm/s per unit of PiCarX.forward speed
+SENSOR_SPACING = 2.0  # cm between neighbouring grayscale sensors
+SENSOR_REACH = 3.0  # cm, beyond this offset no sensor sees the line
+SERVO_TAU = 0.06  # s, time constant of the steering servo
+MAX_LATERAL_ACCEL = 60  # cm/s^2, beyond this the tyres slide and the car turns less
+CONTROL_PERIOD = 0.01  # s
+
+# (length in cm, curvature in 1/cm, positive curving right) of each section
+DEFAULT_TRACK = [(150, 0), (60, 1 / 30), (100, 0), (80, -1 / 35),
+                 (200, 0), (95, 1 / 30), (60, 0), (50, -1 / 25)]
+
+
+class _SteeringServo:
+    # Stands in for PiCarX: records the commanded steering angle
+    def __init__(self):
+        self.command = 0.0
+
+    def set_dir_servo_angle(self, value):
+        self.command = value
+
+    def stop(self):
+        self.command = 0.0
+
+
+def curvature_at(track, s):
+    for length, curvature in track:
+        if s < length:
+            return curvature
+        s -= length
+    return 0.0
+
+
+def run_lap(speed_planner=None, fixed_speed=40, track=DEFAULT_TRACK, seed=0,
+            noise=0.03, time_limit=300.0):
+    """
+    Drives one lap of the track
+    :param speed_planner: SpeedPlanner, or None to drive at fixed_speed
+    :param fixed_speed: float, speed used when there is no planner
+    :return: dict with 'lap_time' (s, None if the line was lost),
+        'distance' driven (cm), 'max_offset' (cm) and 'mean_speed'
+    """
+    rng = np.random.default_rng(seed)
+    servo = _SteeringServo()
+    steering = SteeringController(servo, kp=35, kd=10, max_rate=600)
+    lap_length = sum(length for length, _ in track)
+
+    s = 0.0  # distance along the track
+    offset = 0.0  # cm, positive when the car is right of the line
+    heading = 0.0  # rad, relative to the track, positive to the right
+    wheel_angle = 0.0  # degrees, actual steering angle
+    speed = 0.0
+    t = 0.0
+    max_offset = 0.0
+    speeds = []
+
+    while s < lap_length:
+        if t > time_limit or abs(offset) > SENSOR_REACH:
+            return {'lap_time': None, 'distance': s, 'max_offset': max_offset,
+                    'mean_speed': float(np.mean(speeds)) if speeds else 0.0}
+
+        # Sense: the line is to the left (negative) when the car is right of it
+        rel_line_pos = max(-1.0, min(1.0, -offset / SENSOR_SPACING + rng.normal(0, noise)))
+
+        steering.steer(rel_line_pos, now=t)
+        if speed_planner is None:
+            speed = fixed_speed
+        else:
+            speed = speed_planner.plan(rel_line_pos, None, now=t)
+        speeds.append(speed)
+
+        # Move the car along the track for one control period
+        wheel_angle += (servo.command - wheel_angle) * CONTROL_PERIOD / SERVO_TAU
+        v = speed * SPEED_SCALE
+        yaw_rate = v * math.tan(math.radians(wheel_angle)) / WHEELBASE
+        if v > 0:
+            grip = MAX_LATERAL_ACCEL / v
+            yaw_rate = max(-grip, min(grip, yaw_rate))
+        heading += (yaw_rate - v * curvature_at(track, s)) * CONTROL_PERIOD
+        offset += v * math.sin(heading) * CONTROL_PERIOD
+        s += v * math.cos(heading) * CONTROL_PERIOD
+        t += CONTROL_PERIOD
+        max_offset = max(max_offset, abs(offset))
+
+    return {'lap_time': t, 'distance': s, 'max_offset': max_offset,
+            'mean_speed': float(np.mean(speeds))}
+
+
+def main():
+    print('{:>22s} {:>10s} {:>12s} {:>12s}'.format('speed', 'lap s', 'max offset', 'mean speed'))
+    runs = [('fixed {}'.format(speed), None, speed) for speed in (50, 60, 70, 80)]
+    runs.append(('planner 65-100', SpeedPlanner(max_speed=100, min_speed=65, curve_offset=0.3,
+                                                max_accel=150), None))
+    runs.append(('planner 60-120', SpeedPlanner(max_speed=120, min_speed=60, curve_offset=0.3,
+                                                max_accel=150), None))
+    for name, planner, fixed_speed in runs:
+        result = run_lap(planner, fixed_speed)
+        lap = 'lost line' if result['lap_time'] is None else '{:.2f}'.format(result['lap_time'])
+        print('{:>22s} {:>10s} {:>12.2f} {:>12.1f}'.format(
+            name, lap, result['max_offset'], result['mean_speed']))
+
+
+if __name__ == '__main__':
+    main()
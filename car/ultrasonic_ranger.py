@@ -0,0 +1,143 @@
+"""
+ultrasonic_ranger.py
+
+Interrupt-driven ultrasonic ranging. Sensor.get_collision_distance and
+ezblock's Ultrasonic busy-poll the echo pin for up to 20 ms per reading,
+after an unconditional 10 ms sleep. Here the echo pin's rising and falling
+edges are timestamped by GPIO edge callbacks (ezblock's IRQ) instead, so a
+ping only takes the 10 us trigger pulse, and the distance is published
+whenever its echo comes back.
+
+UltrasonicRanger is a rossros Producer that pings on a fixed schedule and
+writes each distance to its distance_bus from the edge callback:
+
+    ranger = UltrasonicRanger(period=0.06, termination_busses=timer_bus)
+    ultrasonic_con_prod = ConsumerProducer(ultrasonic_interp.obstacle_check,
+                                           ranger.distance_bus, ...)
+
+Outside a graph, call ping() and read the latest distance with distance().
+"""
+
+import threading
+import time
+from logdecorator import log_on_start, log_on_end, log_on_error
+
+try:
+    from ezblock import IRQ, Pin
+except ImportError:
+    from sim_ezblock import IRQ, Pin
+
+from rossros import DEBUG, Bus, Producer, default_termination_bus
+
+SPEED_OF_SOUND = 34000  # cm/s
+NO_ECHO = -1  # distance reported when no echo came back in time
+
+
+class UltrasonicRanger(Producer):
+    """
+    UltrasonicRanger is a producer that triggers an ultrasonic ping every
+    period seconds and writes the distance in cm, or -1 if the echo timed
+    out, to its distance_bus as soon as the echo has been measured
+    """
+
+    @log_on_start(DEBUG, "{name:s}: Starting to create ultrasonic ranger")
+    @log_on_error(DEBUG, "{name:s}: Encountered an error while creating ultrasonic ranger")
+    @log_on_end(DEBUG, "{name:s}: Finished creating ultrasonic ranger")
+    def __init__(self,
+                 trig=None,  # trigger Pin, D0 if None
+                 echo=None,  # echo Pin, D1 if None
+                 period=0.06,  # seconds between pings, long enough for echoes to die down
+                 timeout=0.02,  # seconds to wait for an echo before reporting NO_ECHO
+                 termination_busses=default_termination_bus,
+                 name="Unnamed ultrasonic ranger"):
+
+        self.trig = Pin('D0') if trig is None else trig
+        self.echo = echo = Pin('D1') if echo is None else echo
+        self.timeout = timeout
+        self.distance_bus = Bus(NO_ECHO, name=name + " distance")
+
+        # Edge state, shared with the GPIO callback thread
+        self._lock = threading.Lock()
+        self._ping_time = None
+        self._rise_time = None
+        self._reading = (None, NO_ECHO)
+        self.timeouts = 0
+
+        self.echo_irq = IRQ(echo, IRQ.IRQ_RISING_FALLING, self._on_edge)
+
+        super().__init__(
+            self.ping,  # UltrasonicRanger class defines its own producer function
+            self.distance_bus,
+            period,
+            termination_busses,
+            name,
+            schedule='rate')
+
+    def ping(self):
+        """
+        Triggers a ping and returns without waiting for its echo. A previous
+        ping whose echo has not been measured within the timeout is
+        reported as NO_ECHO first
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = self._ping_time is not None and now - self._ping_time > self.timeout
+            if expired:
+                self._ping_time = None
+        if expired:
+            self._publish(now, NO_ECHO)
+            self.timeouts += 1
+
+        self.trig.low()
+        self.trig.high()
+        time.sleep(0.00001)
+        self.trig.low()
+
+        with self._lock:
+            self._ping_time = time.monotonic()
+            self._rise_time = None
+
+    # Distances are written to the bus by the edge callback, so there is
+    # nothing to deal after a ping
+    def dealValuesToBusses(self, values, busses):
+        pass
+
+    def _on_edge(self, _channel):
+
+        # Echo edges alternate rising, falling, so which one this is follows
+        # from whether the rise of the current ping has been seen. Reading
+        # the pin here could already show the next level for short pulses
+        now = time.monotonic()
+        with self._lock:
+            if self._ping_time is None:
+                return
+            if self._rise_time is None:
+                self._rise_time = now
+                return
+            width = now - self._rise_time
+            self._ping_time = None
+            self._rise_time = None
+
+        if width > self.timeout:
+            self._publish(now, NO_ECHO)
+            self.timeouts += 1
+        else:
+            self._publish(now, round(width * SPEED_OF_SOUND / 2, 2))
+
+    def _publish(self, stamp, cm):
+        self._reading = (stamp, cm)
+        self.distance_bus.set_message(cm, self.name)
+
+    def distance(self):
+        """
+        :return: float, latest distance in cm, or -1 if the last echo timed
+            out or there has not been one yet
+        """
+        return self._reading[1]
+
+    def reading(self):
+        """
+        :return: tuple, (time.monotonic() when the latest distance was
+            measured or None, distance in cm)
+        """
+        return self._reading